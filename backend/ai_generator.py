@@ -1,5 +1,57 @@
+import asyncio
+import atexit
+import functools
+import hashlib
+import json
+import re
+import threading
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
 import anthropic
-from typing import List, Optional, Dict, Any, Tuple
+import httpx
+from typing import List, Optional, Dict, Any, Tuple, Union, Iterator
+from rate_limiter import TokenBucket, CircuitBreaker
+from tool_executor import run_tool_calls, run_tool_calls_async
+
+# Process-wide HTTP client so every AIGenerator reuses one keep-alive pool
+# instead of paying a fresh TCP+TLS handshake per instance. There is no async
+# counterpart: async connections belong to the event loop that opened them,
+# so async clients get a pool per loop (see AIGenerator.async_client)
+_HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30.0)
+_HTTP_TIMEOUT = httpx.Timeout(120.0, connect=10.0)
+_HTTP_CLIENT = anthropic.DefaultHttpxClient(limits=_HTTP_LIMITS, timeout=_HTTP_TIMEOUT)
+
+
+def close_http_clients():
+    """Close the shared HTTP connection pool"""
+    _HTTP_CLIENT.close()
+
+
+atexit.register(close_http_clients)
+
+
+def _is_transient_error(error: Exception) -> bool:
+    """Whether an API error signals upstream trouble rather than a bad request"""
+    if isinstance(error, (anthropic.APIConnectionError, anthropic.RateLimitError)):
+        return True
+    return isinstance(error, anthropic.APIStatusError) and error.status_code >= 500
+
+
+# Let Claude decide whether to use the offered tools
+_AUTO_TOOL_CHOICE = {"type": "auto"}
+
+# Start of each "Role: content" entry in SessionManager's formatted history
+_HISTORY_TURN_PATTERN = re.compile(r"^(?=(?:User|Assistant): )", re.MULTILINE)
+
+
+@dataclass(slots=True)
+class ToolCall:
+    """Record of a single tool invocation"""
+    round: int
+    tool: str
+    params: Dict[str, Any]
+    result_length: int
 
 class ToolCallState:
     """Tracks the state of tool calls across multiple rounds"""
@@ -7,7 +59,7 @@ class ToolCallState:
     def __init__(self, max_rounds: int = 2):
         self.max_rounds = max_rounds
         self.current_round = 0
-        self.tool_calls_made = []
+        self.tool_calls_made: List[ToolCall] = []
     
     def can_make_more_calls(self) -> bool:
         """Check if more tool calls can be made"""
@@ -19,12 +71,52 @@ class ToolCallState:
     
     def add_tool_call(self, tool_name: str, params: Dict[str, Any], result: str):
         """Record a tool call that was made"""
-        self.tool_calls_made.append({
-            'round': self.current_round,
-            'tool': tool_name,
-            'params': params,
-            'result_length': len(result) if result else 0
-        })
+        self.tool_calls_made.append(
+            ToolCall(self.current_round, tool_name, params, len(result) if result else 0)
+        )
+
+class ResponseCache:
+    """LRU cache of final responses keyed by query, history and tool set"""
+    
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def make_key(query: str, conversation_history, tools: Optional[List]) -> str:
+        """Build a stable cache key for a request"""
+        history_signature = (
+            conversation_history if isinstance(conversation_history, str)
+            else json.dumps(conversation_history or "", sort_keys=True, default=str)
+        )
+        tools_signature = json.dumps(tools or [], sort_keys=True, default=str)
+        payload = "|".join((query, history_signature, tools_signature))
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for a key, marking it recently used"""
+        with self._lock:
+            response = self._entries.get(key)
+            if response is not None:
+                self._entries.move_to_end(key)
+            return response
+    
+    def set(self, key: str, response: str):
+        """Store a response, evicting the least recently used entry when full"""
+        with self._lock:
+            self._entries[key] = response
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        """Drop all cached responses"""
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
 
 class AIGenerator:
     """Handles interactions with Anthropic's Claude API for generating responses"""
@@ -77,42 +169,231 @@ All responses must be:
 Provide only the direct answer to what was asked.
 """
     
-    def __init__(self, api_key: str, model: str):
-        self.client = anthropic.Anthropic(api_key=api_key)
+    def __init__(self, api_key: str, model: str, cache_size: int = 1024,
+                 prompt_caching: bool = True, history_window: int = 6,
+                 max_retries: int = 2, requests_per_minute: int = 0,
+                 input_tokens_per_minute: int = 0):
+        # Clients are created on first use, see the client properties below
+        self._api_key = api_key
         self.model = model
         
+        # The SDK retries 408/409/429/5xx and connection errors with
+        # exponential backoff and jitter, honouring retry-after headers
+        self.max_retries = max_retries
+        
+        # Proactive rate limiting (0 disables) and fail-fast on sustained outages
+        self.request_bucket = TokenBucket.per_minute(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket.per_minute(input_tokens_per_minute) if input_tokens_per_minute else None
+        self.circuit_breaker = CircuitBreaker()
+        
         # Pre-build base API parameters
         self.base_params = {
             "model": self.model,
             "temperature": 0,
             "max_tokens": 800
         }
+        
+        # Final responses for repeated requests
+        self.response_cache = ResponseCache(max_size=cache_size)
+        
+        # Async requests currently running, by response cache key
+        self._inflight: Dict[str, asyncio.Task] = {}
+        
+        # Mark the static system prompt and tool schemas as cacheable prefixes
+        self.prompt_caching = prompt_caching
+        
+        # The static system block is built once and shared by every request;
+        # neither this class nor the SDK mutates it
+        self._system_block = {
+            "type": "text",
+            "text": self.SYSTEM_PROMPT,
+            "cache_control": {"type": "ephemeral"}
+        }
+        self._static_system = [self._system_block]
+        
+        # Number of user/assistant exchanges kept from conversation history
+        self.history_window = history_window
+        
+        # A session's history string is unchanged across a request's tool
+        # rounds and its next turn, so memoise the windowed system per string
+        self._system_for_history = functools.lru_cache(maxsize=128)(self._compose_system)
+        
+        # Async API clients by event loop, see async_client
+        self._async_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        
+        # messages.create wrappers specialised for the fixed parameters above
+        self._call, self._acall = self._build_callers()
+    
+    @functools.cached_property
+    def client(self) -> anthropic.Anthropic:
+        """Sync API client, built on first use"""
+        # Clients share the module-level pools; they must never close them
+        return anthropic.Anthropic(
+            api_key=self._api_key, http_client=_HTTP_CLIENT, max_retries=self.max_retries
+        )
+    
+    @property
+    def async_client(self) -> anthropic.AsyncAnthropic:
+        """
+        Async API client for the running event loop, built on first use there.
+        
+        Pooled async connections are bound to the loop that opened them, so
+        reusing one client across asyncio.run() calls fails on the next loop.
+        Each loop gets its own client and pool, dropped along with the loop.
+        """
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = anthropic.AsyncAnthropic(
+                api_key=self._api_key,
+                http_client=anthropic.DefaultAsyncHttpxClient(limits=_HTTP_LIMITS, timeout=_HTTP_TIMEOUT),
+                max_retries=self.max_retries
+            )
+            self._async_clients[loop] = client
+        return client
+    
+    @async_client.setter
+    def async_client(self, client: anthropic.AsyncAnthropic):
+        """Use the given client for the running event loop"""
+        self._async_clients[asyncio.get_running_loop()] = client
+    
+    @classmethod
+    def warmup(cls, url: str = "https://api.anthropic.com/v1/messages", timeout: float = 5.0) -> bool:
+        """
+        Open a keep-alive connection to the API through the shared HTTP pool.
+        
+        Saves the first user query the TCP and TLS handshake. The request is
+        unauthenticated, so any HTTP status (typically 401 or 405) counts as
+        success; only transport errors are reported.
+        
+        Returns:
+            Whether a connection was established
+        """
+        try:
+            _HTTP_CLIENT.head(url, timeout=timeout)
+        except httpx.HTTPError as e:
+            print(f"Anthropic API warmup failed: {e}")
+            return False
+        return True
     
     def generate_response(self, query: str,
-                         conversation_history: Optional[str] = None,
+                         conversation_history: Optional[Union[str, List[Dict]]] = None,
                          tools: Optional[List] = None,
                          tool_manager=None,
-                         max_tool_rounds: int = 2) -> str:
+                         max_tool_rounds: int = 2,
+                         cache: Union[bool, str] = True) -> str:
         """
         Generate AI response with optional sequential tool usage and conversation context.
         
         Args:
             query: The user's question or request
-            conversation_history: Previous messages for context
+            conversation_history: Previous messages for context, either the
+                formatted history string or a list of {"role", "content"} dicts
             tools: Available tools the AI can use
             tool_manager: Manager to execute tools
             max_tool_rounds: Maximum number of sequential tool calls allowed
+            cache: True to serve repeats from the response cache, "force" to
+                cache even when tools run, False to always call the API
             
         Returns:
             Generated response as string
         """
+        cache_key = self._response_cache_key(query, conversation_history, tools, tool_manager, cache)
+        if cache_key is not None:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return cached
         
-        # Build system content efficiently - avoid string ops when possible
-        system_content = (
-            f"{self.SYSTEM_PROMPT}\n\nPrevious conversation:\n{conversation_history}"
-            if conversation_history 
-            else self.SYSTEM_PROMPT
+        response_text = self._generate(
+            query, conversation_history, tools, tool_manager, max_tool_rounds
+        )
+        
+        if cache_key is not None:
+            self.response_cache.set(cache_key, response_text)
+        return response_text
+    
+    def generate_response_stream(self, query: str,
+                                 conversation_history: Optional[Union[str, List[Dict]]] = None,
+                                 tools: Optional[List] = None,
+                                 tool_manager=None,
+                                 max_tool_rounds: int = 2,
+                                 cache: Union[bool, str] = True) -> Iterator[str]:
+        """
+        Generate AI response like generate_response, yielding text as it arrives.
+        
+        Tool rounds still run as regular requests because their stop_reason and
+        content blocks are needed before continuing; only the final synthesis
+        is streamed.
+        
+        Args:
+            query: The user's question or request
+            conversation_history: Previous messages for context
+            tools: Available tools the AI can use
+            tool_manager: Manager to execute tools
+            max_tool_rounds: Maximum number of sequential tool calls allowed
+            cache: Same semantics as in generate_response
+            
+        Yields:
+            Chunks of response text
+        """
+        cache_key = self._response_cache_key(query, conversation_history, tools, tool_manager, cache)
+        if cache_key is not None:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+        
+        response_text, messages, system_content = self._run_tool_loop(
+            query, conversation_history, tools, tool_manager, max_tool_rounds
+        )
+        
+        if response_text is None:
+            chunks = []
+            self._admit(messages, system_content, None)
+            try:
+                with self.client.messages.stream(
+                    messages=messages, system=system_content, **self.base_params
+                ) as stream:
+                    for text in stream.text_stream:
+                        chunks.append(text)
+                        yield text
+            except Exception as e:
+                self._record_failure(e)
+                raise
+            self.circuit_breaker.record_success()
+            response_text = "".join(chunks)
+        else:
+            yield response_text
+        
+        if cache_key is not None:
+            self.response_cache.set(cache_key, response_text)
+    
+    def _generate(self, query: str, conversation_history: Optional[Union[str, List[Dict]]],
+                  tools: Optional[List], tool_manager, max_tool_rounds: int) -> str:
+        """Run the tool loop and final synthesis without consulting the cache"""
+        response_text, messages, system_content = self._run_tool_loop(
+            query, conversation_history, tools, tool_manager, max_tool_rounds
         )
+        if response_text is not None:
+            return response_text
+        
+        # Max rounds reached or no more tool calls needed - make final call without tools
+        return self._make_final_response(messages, system_content)
+    
+    def _run_tool_loop(self, query: str, conversation_history: Optional[Union[str, List[Dict]]],
+                       tools: Optional[List], tool_manager, max_tool_rounds: int) -> Tuple[Optional[str], List[Dict], Any]:
+        """
+        Run sequential tool rounds until Claude answers or the round limit is hit.
+        
+        Returns:
+            Tuple of (response text if Claude answered directly, otherwise None;
+            accumulated messages; system content for the final synthesis call)
+        """
+        # Build system content efficiently - avoid string ops when possible
+        system_content = self._build_system(conversation_history)
+        
+        # Tools are constant across rounds, so prepare them once up front
+        request_tools = self._request_tools(tools, tool_manager)
         
         # Initialize message history and tool state
         messages = [{"role": "user", "content": query}]
@@ -120,20 +401,8 @@ Provide only the direct answer to what was asked.
         
         # Process tool calls iteratively
         while tool_state.can_make_more_calls():
-            # Prepare API call parameters with tools available
-            api_params = {
-                **self.base_params,
-                "messages": messages,
-                "system": system_content
-            }
-            
-            # Add tools if available and we can still make tool calls
-            if tools and tool_manager:
-                api_params["tools"] = tools
-                api_params["tool_choice"] = {"type": "auto"}
-            
             # Get response from Claude
-            response = self.client.messages.create(**api_params)
+            response = self._call(messages, system_content, request_tools)
             
             # Check if Claude wants to use tools
             if response.stop_reason == "tool_use":
@@ -142,73 +411,458 @@ Provide only the direct answer to what was asked.
                     response, messages, tool_manager, tool_state
                 )
                 
-                # If no tools were executed (error case), break
+                # No tool_use blocks despite the stop reason: whatever text
+                # Claude produced is the answer, no synthesis call needed
                 if not tools_executed:
-                    break
+                    return self._response_text(response), messages, system_content
                     
                 # Increment round counter
                 tool_state.increment_round()
             else:
                 # Claude doesn't want to use tools, return the response
-                return response.content[0].text
+                return self._response_text(response), messages, system_content
         
-        # Max rounds reached or no more tool calls needed - make final call without tools
-        return self._make_final_response(messages, system_content)
+        # Max rounds reached or no more tool calls needed - final synthesis still required
+        return None, messages, system_content
+    
+    async def generate_response_async(self, query: str,
+                                      conversation_history: Optional[Union[str, List[Dict]]] = None,
+                                      tools: Optional[List] = None,
+                                      tool_manager=None,
+                                      max_tool_rounds: int = 2,
+                                      cache: Union[bool, str] = True) -> str:
+        """
+        Async variant of generate_response using the AsyncAnthropic client.
+        
+        Tool calls requested in the same round are executed concurrently,
+        so a round with N tool_use blocks takes as long as its slowest tool.
+        Concurrent identical requests that are eligible for the response cache
+        share a single in-flight API call.
+        
+        Args:
+            query: The user's question or request
+            conversation_history: Previous messages for context
+            tools: Available tools the AI can use
+            tool_manager: Manager to execute tools
+            max_tool_rounds: Maximum number of sequential tool calls allowed
+            cache: True to serve repeats from the response cache, "force" to
+                cache even when tools run, False to always call the API
+        
+        Returns:
+            Generated response as string
+        """
+        cache_key = self._response_cache_key(query, conversation_history, tools, tool_manager, cache)
+        if cache_key is None:
+            return await self._generate_async(
+                query, conversation_history, tools, tool_manager, max_tool_rounds
+            )
+        
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        # Identical requests arriving while one is in flight share its API call
+        loop = asyncio.get_running_loop()
+        task = self._inflight.get(cache_key)
+        if task is None or task.get_loop() is not loop:
+            task = loop.create_task(self._generate_async(
+                query, conversation_history, tools, tool_manager, max_tool_rounds
+            ))
+            self._inflight[cache_key] = task
+            task.add_done_callback(functools.partial(self._finish_inflight, cache_key))
+        
+        # Shielded so one caller giving up does not cancel the call for the rest
+        return await asyncio.shield(task)
+    
+    def _finish_inflight(self, cache_key: str, task: asyncio.Task):
+        """Drop a finished request from the in-flight map and cache its answer"""
+        if self._inflight.get(cache_key) is task:
+            del self._inflight[cache_key]
+        
+        # Retrieving the exception also keeps asyncio from logging it as
+        # unhandled when every waiter was cancelled
+        if not task.cancelled() and task.exception() is None:
+            self.response_cache.set(cache_key, task.result())
+    
+    async def _generate_async(self, query: str, conversation_history: Optional[Union[str, List[Dict]]],
+                              tools: Optional[List], tool_manager, max_tool_rounds: int) -> str:
+        """Async counterpart of _generate"""
+        system_content = self._build_system(conversation_history)
+        request_tools = self._request_tools(tools, tool_manager)
+        
+        messages = [{"role": "user", "content": query}]
+        tool_state = ToolCallState(max_rounds=max_tool_rounds)
+        
+        while tool_state.can_make_more_calls():
+            response = await self._acall(messages, system_content, request_tools)
+            
+            if response.stop_reason == "tool_use":
+                messages, tools_executed = await self._execute_tool_round_async(
+                    response, messages, tool_manager, tool_state
+                )
+                
+                if not tools_executed:
+                    return self._response_text(response)
+                
+                tool_state.increment_round()
+            else:
+                return self._response_text(response)
+        
+        return await self._make_final_response_async(messages, system_content)
+    
+    async def generate_responses_batch(self, queries: List[str],
+                                       conversation_histories: Optional[List[Optional[str]]] = None,
+                                       use_batch_api: bool = True,
+                                       max_concurrency: int = 10,
+                                       poll_interval: float = 5.0,
+                                       max_poll_interval: float = 60.0) -> List[str]:
+        """
+        Generate responses for many independent queries without tool use.
+        
+        With use_batch_api the requests go through the Message Batches API,
+        which is billed at half price but may take a while to complete.
+        Otherwise they are sent concurrently through generate_response_async,
+        at most max_concurrency in flight at a time.
+        
+        Batch submission goes through the circuit breaker and takes one slot
+        from the request bucket, but is not charged to the input token
+        bucket: batched requests count against the Message Batches API's own
+        limits, not the per-minute limits that bucket mirrors.
+        
+        Args:
+            queries: The questions to answer
+            conversation_histories: Optional history per query, aligned with queries
+            use_batch_api: Submit a message batch instead of individual requests
+            max_concurrency: Concurrent request limit when not using the batch API
+            poll_interval: Initial delay between batch status checks, in seconds
+            max_poll_interval: Upper bound for the exponential polling delay
+            
+        Returns:
+            Responses in the same order as queries
+        """
+        histories = conversation_histories or [None] * len(queries)
+        if len(histories) != len(queries):
+            raise ValueError("conversation_histories must align with queries")
+        if not queries:
+            return []
+        
+        if not use_batch_api:
+            semaphore = asyncio.Semaphore(max_concurrency)
+            
+            async def generate(query: str, history: Optional[str]) -> str:
+                async with semaphore:
+                    return await self.generate_response_async(query, conversation_history=history)
+            
+            return list(await asyncio.gather(*[
+                generate(query, history) for query, history in zip(queries, histories)
+            ]))
+        
+        self.circuit_breaker.before_call()
+        if self.request_bucket:
+            await self.request_bucket.acquire_async(1)
+        
+        batches = self.async_client.messages.batches
+        try:
+            batch = await batches.create(requests=[
+                {
+                    "custom_id": f"q{i}",
+                    "params": {
+                        **self.base_params,
+                        "system": self._build_system(history),
+                        "messages": [{"role": "user", "content": query}]
+                    }
+                }
+                for i, (query, history) in enumerate(zip(queries, histories))
+            ])
+        except Exception as e:
+            self._record_failure(e)
+            raise
+        self.circuit_breaker.record_success()
+        
+        # Poll with exponential backoff until every request has finished
+        delay = poll_interval
+        while batch.processing_status != "ended":
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_poll_interval)
+            batch = await batches.retrieve(batch.id)
+        
+        # Results arrive in arbitrary order; map them back by custom_id
+        responses: List[Optional[str]] = [None] * len(queries)
+        failed = []
+        async for entry in await batches.results(batch.id):
+            index = int(entry.custom_id[1:])
+            if entry.result.type == "succeeded":
+                responses[index] = self._response_text(entry.result.message)
+            else:
+                failed.append(f"{entry.custom_id} ({entry.result.type})")
+        
+        if failed:
+            raise RuntimeError(f"Message batch {batch.id} had failed requests: {', '.join(failed)}")
+        return responses
+    
+    def _windowed_history(self, history: Optional[Union[str, List[Dict]]]) -> Optional[str]:
+        """
+        Keep only the most recent history_window exchanges of a conversation.
+        
+        Bounds the input tokens spent on history regardless of session length.
+        Accepts the "User: ...\nAssistant: ..." string built by SessionManager
+        or a list of message dicts.
+        """
+        if not history:
+            return None
+        
+        max_entries = 2 * self.history_window
+        if not isinstance(history, str):
+            return "\n".join(
+                f"{message['role'].title()}: {message['content']}"
+                for message in history[-max_entries:]
+            )
+        
+        # Each entry keeps its trailing newline, so joining restores the format
+        turns = [turn for turn in _HISTORY_TURN_PATTERN.split(history) if turn]
+        if len(turns) <= max_entries:
+            return history
+        return "".join(turns[-max_entries:])
+    
+    def _build_system(self, conversation_history: Optional[Union[str, List[Dict]]]):
+        """
+        Build the system parameter for a request.
+        
+        String history is served from a per-instance LRU cache; the returned
+        value is shared between requests and must not be mutated.
+        """
+        if conversation_history and isinstance(conversation_history, str):
+            return self._system_for_history(conversation_history)
+        return self._compose_system(conversation_history)
+    
+    def _compose_system(self, conversation_history: Optional[Union[str, List[Dict]]]):
+        """
+        Window the history and combine it with the system prompt.
+        
+        With prompt caching the static prompt is its own block carrying the
+        cache breakpoint, so per-session history never invalidates it.
+        """
+        conversation_history = self._windowed_history(conversation_history)
+        if not self.prompt_caching:
+            return (
+                f"{self.SYSTEM_PROMPT}\n\nPrevious conversation:\n{conversation_history}"
+                if conversation_history
+                else self.SYSTEM_PROMPT
+            )
+        
+        if not conversation_history:
+            return self._static_system
+        return [self._system_block, {
+            "type": "text",
+            "text": f"Previous conversation:\n{conversation_history}"
+        }]
+    
+    def _build_callers(self):
+        """
+        Build sync and async messages.create wrappers for this generator.
+        
+        Model, temperature and max_tokens are bound as closure locals, so each
+        request passes keywords directly instead of merging base_params. The
+        clients are still looked up per call since they are created lazily.
+        
+        Returns:
+            Tuple of (call, acall), both taking (messages, system, tools=None)
+        """
+        model = self.base_params["model"]
+        temperature = self.base_params["temperature"]
+        max_tokens = self.base_params["max_tokens"]
+        
+        def create(messages: List[Dict], system, tools: Optional[List]):
+            if tools is None:
+                return self.client.messages.create(
+                    model=model, temperature=temperature, max_tokens=max_tokens,
+                    messages=messages, system=system
+                )
+            return self.client.messages.create(
+                model=model, temperature=temperature, max_tokens=max_tokens,
+                messages=messages, system=system, tools=tools, tool_choice=_AUTO_TOOL_CHOICE
+            )
+        
+        async def acreate(messages: List[Dict], system, tools: Optional[List]):
+            if tools is None:
+                return await self.async_client.messages.create(
+                    model=model, temperature=temperature, max_tokens=max_tokens,
+                    messages=messages, system=system
+                )
+            return await self.async_client.messages.create(
+                model=model, temperature=temperature, max_tokens=max_tokens,
+                messages=messages, system=system, tools=tools, tool_choice=_AUTO_TOOL_CHOICE
+            )
+        
+        def call(messages: List[Dict], system, tools: Optional[List] = None):
+            self._admit(messages, system, tools)
+            try:
+                response = create(messages, system, tools)
+            except Exception as e:
+                self._record_failure(e)
+                raise
+            self.circuit_breaker.record_success()
+            return response
+        
+        async def acall(messages: List[Dict], system, tools: Optional[List] = None):
+            await self._admit_async(messages, system, tools)
+            try:
+                response = await acreate(messages, system, tools)
+            except Exception as e:
+                self._record_failure(e)
+                raise
+            self.circuit_breaker.record_success()
+            return response
+        
+        return call, acall
+    
+    def _admit(self, messages: List[Dict], system, tools: Optional[List]):
+        """Check the circuit breaker and wait for rate-limit budget before a request"""
+        self.circuit_breaker.before_call()
+        if self.request_bucket:
+            self.request_bucket.acquire(1)
+        if self.token_bucket:
+            self.token_bucket.acquire(self._estimate_input_tokens(messages, system, tools))
+    
+    async def _admit_async(self, messages: List[Dict], system, tools: Optional[List]):
+        """Async counterpart of _admit"""
+        self.circuit_breaker.before_call()
+        if self.request_bucket:
+            await self.request_bucket.acquire_async(1)
+        if self.token_bucket:
+            await self.token_bucket.acquire_async(self._estimate_input_tokens(messages, system, tools))
+    
+    def _record_failure(self, error: Exception):
+        """Count upstream failures towards opening the circuit"""
+        if _is_transient_error(error):
+            self.circuit_breaker.record_failure()
+        else:
+            # Anything else, such as a 4xx, means the API itself is reachable
+            self.circuit_breaker.record_success()
+    
+    def _estimate_input_tokens(self, messages: List[Dict], system, tools: Optional[List]) -> int:
+        """Rough input token count (~4 characters per token) for rate limiting"""
+        if isinstance(system, str):
+            chars = len(system)
+        else:
+            chars = sum(len(block["text"]) for block in system)
+        chars += len(json.dumps(messages, default=str))
+        if tools:
+            chars += len(json.dumps(tools, default=str))
+        return chars // 4
+    
+    def _request_tools(self, tools: Optional[List], tool_manager) -> Optional[List]:
+        """Return the tools to offer for a request, or None when tools are disabled"""
+        # Tools are only offered when there is a manager to execute them
+        if tools and tool_manager:
+            return self._with_tool_cache(tools)
+        return None
+    
+    def _with_tool_cache(self, tools: List) -> List:
+        """Return tools with a cache breakpoint on the last schema, leaving the input untouched"""
+        if not self.prompt_caching:
+            return tools
+        return [*tools[:-1], {**tools[-1], "cache_control": {"type": "ephemeral"}}]
+    
+    def _response_cache_key(self, query: str, conversation_history: Optional[Union[str, List[Dict]]],
+                            tools: Optional[List], tool_manager, cache: Union[bool, str]) -> Optional[str]:
+        """
+        Return the cache key for a request, or None if it must not be cached.
+        
+        Tool results depend on the current knowledge base, so requests that run
+        tools are only cached when the caller opts in with cache="force".
+        """
+        if not cache or (tool_manager is not None and cache != "force"):
+            return None
+        return ResponseCache.make_key(query, conversation_history, tools)
     
     def _execute_tool_round(self, response, messages: List[Dict], tool_manager, tool_state: ToolCallState) -> Tuple[List[Dict], bool]:
         """
-        Execute a round of tool calls and update message history.
+        Execute a round of tool calls and append them to the message history.
+        
+        A lone tool call runs inline on the calling thread. Several calls go
+        through run_tool_calls: calls to different tools run concurrently on
+        the shared tool pool, each limited to the manager's tool_timeout. The
+        messages list is extended in place and returned as-is.
         
         Args:
             response: The response containing tool use requests
-            messages: Current message history
+            messages: Current message history, mutated in place
             tool_manager: Manager to execute tools
             tool_state: State tracker for tool calls
             
         Returns:
-            Tuple of (updated messages, whether any tools were executed)
+            Tuple of (messages, whether any tools were executed)
         """
-        # Create a copy of messages to avoid mutation
-        updated_messages = messages.copy()
-        
         # Add AI's tool use response
-        updated_messages.append({"role": "assistant", "content": response.content})
-        
-        # Execute all tool calls and collect results
-        tool_results = []
-        tools_executed = False
-        
-        for content_block in response.content:
-            if content_block.type == "tool_use":
-                # Execute the tool
-                tool_result = tool_manager.execute_tool(
-                    content_block.name, 
-                    **content_block.input
-                )
-                
-                # Track the tool call
-                tool_state.add_tool_call(
-                    content_block.name,
-                    content_block.input,
-                    tool_result
-                )
-                
-                # Add to results
-                tool_results.append({
-                    "type": "tool_result",
-                    "tool_use_id": content_block.id,
-                    "content": tool_result
-                })
-                
-                tools_executed = True
+        messages.append({"role": "assistant", "content": response.content})
         
-        # Add tool results as single message
-        if tool_results:
-            updated_messages.append({"role": "user", "content": tool_results})
+        # Pick out the tool calls
+        tool_blocks = [block for block in response.content if block.type == "tool_use"]
+        if not tool_blocks:
+            return messages, False
         
-        return updated_messages, tools_executed
+        if len(tool_blocks) == 1:
+            # Common case of a lone tool call: nothing to overlap, so skip the
+            # scheduler and its pool hop. A thread cannot be interrupted, so
+            # the timeout is not applied here
+            block = tool_blocks[0]
+            results = [tool_manager.execute_tool(block.name, **block.input)]
+        else:
+            results = run_tool_calls(
+                tool_manager.execute_tool, tool_blocks, getattr(tool_manager, "tool_timeout", None)
+            )
+        self._append_tool_results(messages, tool_blocks, results, tool_state)
+        return messages, True
     
-    def _make_final_response(self, messages: List[Dict], system_content: str) -> str:
+    async def _execute_tool_round_async(self, response, messages: List[Dict], tool_manager, tool_state: ToolCallState) -> Tuple[List[Dict], bool]:
+        """
+        Execute a round of tool calls without blocking, extending messages in place.
+        
+        Calls to different tools run concurrently, as in _execute_tool_round.
+        
+        Args:
+            response: The response containing tool use requests
+            messages: Current message history, mutated in place
+            tool_manager: Manager to execute tools
+            tool_state: State tracker for tool calls
+        
+        Returns:
+            Tuple of (messages, whether any tools were executed)
+        """
+        messages.append({"role": "assistant", "content": response.content})
+        
+        # Collect all tool calls first so they can run side by side
+        tool_blocks = [block for block in response.content if block.type == "tool_use"]
+        if not tool_blocks:
+            return messages, False
+        
+        if len(tool_blocks) == 1:
+            # A lone tool call has nothing to run alongside, so skip the scheduler
+            block = tool_blocks[0]
+            results = [await tool_manager.execute_tool_async(block.name, **block.input)]
+        else:
+            results = await run_tool_calls_async(tool_manager.execute_tool_async, tool_blocks)
+        self._append_tool_results(messages, tool_blocks, results, tool_state)
+        return messages, True
+    
+    def _append_tool_results(self, messages: List[Dict], tool_blocks: List, results: List[str],
+                             tool_state: ToolCallState):
+        """Record executed tool calls and add their results as a single user message"""
+        for block, tool_result in zip(tool_blocks, results):
+            tool_state.add_tool_call(block.name, block.input, tool_result)
+        
+        messages.append({"role": "user", "content": [
+            {"type": "tool_result", "tool_use_id": block.id, "content": tool_result}
+            for block, tool_result in zip(tool_blocks, results)
+        ]})
+    
+    @staticmethod
+    def _response_text(response) -> str:
+        """Join the text blocks of a response, skipping tool_use and other blocks"""
+        return "".join(block.text for block in response.content if block.type == "text")
+    
+    def _make_final_response(self, messages: List[Dict], system_content) -> str:
         """
         Make a final API call without tools to generate the synthesis response.
         
@@ -219,13 +873,20 @@ Provide only the direct answer to what was asked.
         Returns:
             Final response text
         """
-        # Prepare final API call WITHOUT tools
-        final_params = {
-            **self.base_params,
-            "messages": messages,
-            "system": system_content
-        }
+        # Final API call WITHOUT tools
+        final_response = self._call(messages, system_content)
+        return self._response_text(final_response)
+    
+    async def _make_final_response_async(self, messages: List[Dict], system_content) -> str:
+        """
+        Async variant of _make_final_response.
         
-        # Get final response
-        final_response = self.client.messages.create(**final_params)
-        return final_response.content[0].text
\ No newline at end of file
+        Args:
+            messages: Complete message history including tool results
+            system_content: System prompt content
+            
+        Returns:
+            Final response text
+        """
+        final_response = await self._acall(messages, system_content)
+        return self._response_text(final_response)
@@ -2,15 +2,19 @@ import warnings
 warnings.filterwarnings("ignore", message="resource_tracker: There appear to be.*")
 
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
+import asyncio
+import json
 import os
 
 from config import config
 from rag_system import RAGSystem
+from ai_generator import AIGenerator
 
 # Initialize FastAPI app
 app = FastAPI(title="Course Materials RAG System", root_path="")
@@ -54,8 +58,10 @@ class CourseStats(BaseModel):
 # API Endpoints
 
 @app.post("/api/query", response_model=QueryResponse)
-async def query_documents(request: QueryRequest):
+def query_documents(request: QueryRequest):
     """Process a query and return response with sources"""
+    # A plain def runs in FastAPI's threadpool: the API call, tool searches and
+    # rate-limit waits block, and must not stall the event loop
     try:
         # Create session if not provided
         session_id = request.session_id
@@ -73,6 +79,27 @@ async def query_documents(request: QueryRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/query/stream")
+async def query_documents_stream(request: QueryRequest):
+    """Process a query and stream the answer as newline-delimited JSON events"""
+    # Create session if not provided
+    session_id = request.session_id
+    if not session_id:
+        session_id = rag_system.session_manager.create_session()
+    
+    def event_stream():
+        # StreamingResponse iterates sync generators in the threadpool, so
+        # blocking calls and rate-limit waits keep off the event loop
+        try:
+            for event in rag_system.query_stream(request.query, session_id):
+                if event["type"] == "done":
+                    event["session_id"] = session_id
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
+    
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
 @app.get("/api/courses", response_model=CourseStats)
 async def get_course_stats():
     """Get course analytics and statistics"""
@@ -100,6 +127,9 @@ async def clear_session(session_id: Optional[str] = None):
 @app.on_event("startup")
 async def startup_event():
     """Load initial documents on startup"""
+    # Open the API connection in the background while documents load
+    app.state.api_warmup = asyncio.get_running_loop().run_in_executor(None, AIGenerator.warmup)
+    
     docs_path = "../docs"
     if os.path.exists(docs_path):
         print("Loading initial documents...")
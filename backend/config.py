@@ -11,6 +11,14 @@ class Config:
     # Anthropic API settings
     ANTHROPIC_API_KEY: str = os.getenv("ANTHROPIC_API_KEY", "")
     ANTHROPIC_MODEL: str = "claude-sonnet-4-20250514"
+    ENABLE_PROMPT_CACHING: bool = True  # Cache system prompt and tool schemas server-side
+    ANTHROPIC_MAX_RETRIES: int = 2       # SDK retries with exponential backoff on 429/5xx
+    REQUESTS_PER_MINUTE: int = 0         # Client-side request rate limit (0 disables)
+    INPUT_TOKENS_PER_MINUTE: int = 0     # Client-side input token rate limit (0 disables)
+    # Seconds a tool call may run before it is reported as timed out. Applies
+    # to every async call and to sync rounds with several calls; a lone sync
+    # call runs inline on the request thread and is not bounded
+    TOOL_TIMEOUT: float = 30.0
     
     # Embedding model settings
     EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
@@ -1,4 +1,5 @@
-from typing import List, Tuple, Optional, Dict
+from typing import List, Tuple, Optional, Dict, Iterator, Any
+import functools
 import os
 from document_processor import DocumentProcessor
 from vector_store import VectorStore
@@ -16,11 +17,18 @@ class RAGSystem:
         # Initialize core components
         self.document_processor = DocumentProcessor(config.CHUNK_SIZE, config.CHUNK_OVERLAP)
         self.vector_store = VectorStore(config.CHROMA_PATH, config.EMBEDDING_MODEL, config.MAX_RESULTS)
-        self.ai_generator = AIGenerator(config.ANTHROPIC_API_KEY, config.ANTHROPIC_MODEL)
+        self.ai_generator = AIGenerator(
+            config.ANTHROPIC_API_KEY,
+            config.ANTHROPIC_MODEL,
+            prompt_caching=config.ENABLE_PROMPT_CACHING,
+            max_retries=config.ANTHROPIC_MAX_RETRIES,
+            requests_per_minute=config.REQUESTS_PER_MINUTE,
+            input_tokens_per_minute=config.INPUT_TOKENS_PER_MINUTE
+        )
         self.session_manager = SessionManager(config.MAX_HISTORY)
         
         # Initialize search tools
-        self.tool_manager = ToolManager()
+        self.tool_manager = ToolManager(tool_timeout=config.TOOL_TIMEOUT)
         self.search_tool = CourseSearchTool(self.vector_store)
         self.outline_tool = CourseOutlineTool(self.vector_store)
         self.tool_manager.register_tool(self.search_tool)
@@ -120,8 +128,13 @@ class RAGSystem:
         if session_id:
             history = self.session_manager.get_conversation_history(session_id)
         
+        # Tools record sources in this query's own context, so concurrent
+        # queries never see each other's sources
+        sources_context = self.tool_manager.sources_context()
+        
         # Generate response using AI with tools
-        response = self.ai_generator.generate_response(
+        response = sources_context.run(
+            self.ai_generator.generate_response,
             query=prompt,
             conversation_history=history,
             tools=self.tool_manager.get_tool_definitions(),
@@ -129,10 +142,7 @@ class RAGSystem:
         )
         
         # Get sources from the search tool
-        sources = self.tool_manager.get_last_sources()
-
-        # Reset sources after retrieving them
-        self.tool_manager.reset_sources()
+        sources = sources_context.run(self.tool_manager.get_last_sources)
         
         # Update conversation history
         if session_id:
@@ -141,6 +151,50 @@ class RAGSystem:
         # Return response with sources from tool searches
         return response, sources
     
+    def query_stream(self, query: str, session_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Process a user query like query(), streaming the answer as it is generated.
+        
+        Args:
+            query: User's question
+            session_id: Optional session ID for conversation context
+            
+        Yields:
+            {"type": "delta", "text": ...} events for each chunk of the answer,
+            then a final {"type": "done", "sources": [...]} event
+        """
+        prompt = f"""Answer this question about course materials: {query}"""
+        
+        history = None
+        if session_id:
+            history = self.session_manager.get_conversation_history(session_id)
+        
+        # As in query(), each step of the stream runs in this query's context
+        sources_context = self.tool_manager.sources_context()
+        stream = self.ai_generator.generate_response_stream(
+            query=prompt,
+            conversation_history=history,
+            tools=self.tool_manager.get_tool_definitions(),
+            tool_manager=self.tool_manager
+        )
+        
+        chunks = []
+        sources = None
+        for text in iter(functools.partial(sources_context.run, next, stream, None), None):
+            # Tool rounds are finished once the first chunk arrives
+            if sources is None:
+                sources = sources_context.run(self.tool_manager.get_last_sources)
+            chunks.append(text)
+            yield {"type": "delta", "text": text}
+        
+        if sources is None:
+            sources = sources_context.run(self.tool_manager.get_last_sources)
+        
+        if session_id:
+            self.session_manager.add_exchange(session_id, query, "".join(chunks))
+        
+        yield {"type": "done", "sources": sources}
+    
     def get_course_analytics(self) -> Dict:
         """Get analytics about the course catalog"""
         return {
@@ -0,0 +1,103 @@
+import asyncio
+import threading
+import time
+from typing import Optional
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when a call is rejected because the circuit breaker is open"""
+    pass
+
+
+class TokenBucket:
+    """Token bucket limiting how fast a budget (requests, tokens) is spent"""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate            # Tokens added per second
+        self.capacity = capacity    # Maximum burst size
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def per_minute(cls, limit: float) -> 'TokenBucket':
+        """Create a bucket allowing `limit` tokens per minute, all usable as a burst"""
+        return cls(rate=limit / 60, capacity=limit)
+    
+    def reserve(self, amount: float = 1) -> float:
+        """
+        Take tokens from the bucket, going into debt if necessary.
+        
+        Returns:
+            Seconds the caller must wait before the reserved tokens are available
+        """
+        # A single request larger than the bucket could otherwise never proceed
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+    
+    def acquire(self, amount: float = 1):
+        """Block until `amount` tokens are available"""
+        wait = self.reserve(amount)
+        if wait > 0:
+            time.sleep(wait)
+    
+    async def acquire_async(self, amount: float = 1):
+        """Wait without blocking the event loop until `amount` tokens are available"""
+        wait = self.reserve(amount)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class CircuitBreaker:
+    """Fails fast after repeated upstream failures, then probes again after a cooldown"""
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+    
+    @property
+    def is_open(self) -> bool:
+        """Whether the circuit has tripped and not yet recovered"""
+        return self._opened_at is not None
+    
+    def before_call(self):
+        """
+        Admit a call or raise CircuitOpenError.
+        
+        Once the cooldown has passed a single probe call is let through and the
+        cooldown restarts; the probe's outcome decides whether the circuit closes.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return
+            now = time.monotonic()
+            remaining = self.reset_timeout - (now - self._opened_at)
+            if remaining > 0:
+                raise CircuitOpenError(
+                    f"Circuit open after {self._failures} consecutive failures; "
+                    f"retrying in {remaining:.0f}s"
+                )
+            self._opened_at = now
+    
+    def record_success(self):
+        """Close the circuit after a successful call"""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+    
+    def record_failure(self):
+        """Count a failed call, opening the circuit once the threshold is reached"""
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
@@ -1,6 +1,17 @@
+import asyncio
+import contextvars
+import functools
+import inspect
 from typing import Dict, Any, Optional, Protocol
 from abc import ABC, abstractmethod
 from vector_store import VectorStore, SearchResults
+from tool_executor import TOOL_POOL, timeout_message
+
+# Sources recorded by tools during the current request, keyed by tool. Each
+# query gets its own mapping (see ToolManager.sources_context), so neither a
+# concurrent query nor a call finishing after its query timed it out can
+# change another query's sources
+_request_sources: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("request_sources", default=None)
 
 
 class Tool(ABC):
@@ -17,9 +28,38 @@ class Tool(ABC):
         pass
 
 
+class RequestSources:
+    """
+    Descriptor for a tool's last_sources that keeps them per request.
+    
+    Inside a context from ToolManager.sources_context() the value lives in
+    that context's mapping; elsewhere it is a plain instance attribute.
+    """
+    
+    def __set_name__(self, owner, name):
+        self.attr = f"_{name}"
+    
+    def __get__(self, tool, owner=None):
+        if tool is None:
+            return self
+        sources = _request_sources.get()
+        if sources is not None:
+            return sources.get(tool, [])
+        return getattr(tool, self.attr, [])
+    
+    def __set__(self, tool, value):
+        sources = _request_sources.get()
+        if sources is not None:
+            sources[tool] = value
+        else:
+            setattr(tool, self.attr, value)
+
+
 class CourseSearchTool(Tool):
     """Tool for searching course content with semantic course name matching"""
     
+    last_sources = RequestSources()
+    
     def __init__(self, vector_store: VectorStore):
         self.store = vector_store
         self.last_sources = []  # Track sources from last search
@@ -127,6 +167,8 @@ class CourseSearchTool(Tool):
 class CourseOutlineTool(Tool):
     """Tool for retrieving complete course outlines with lessons"""
     
+    last_sources = RequestSources()
+    
     def __init__(self, vector_store: VectorStore):
         self.store = vector_store
         self.last_sources = []  # Track sources from last search
@@ -206,11 +248,64 @@ class CourseOutlineTool(Tool):
         return "\n".join(formatted)
 
 
+class ToolRegistry(dict):
+    """Tool name -> tool mapping that counts its mutations"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version = 0
+    
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.version += 1
+    
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.version += 1
+    
+    def __ior__(self, other):
+        self.update(other)
+        return self
+    
+    def clear(self):
+        super().clear()
+        self.version += 1
+    
+    def pop(self, *args):
+        self.version += 1
+        return super().pop(*args)
+    
+    def popitem(self):
+        self.version += 1
+        return super().popitem()
+    
+    def setdefault(self, key, default=None):
+        self.version += 1
+        return super().setdefault(key, default)
+    
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self.version += 1
+
+
 class ToolManager:
     """Manages available tools for the AI"""
     
-    def __init__(self):
+    def __init__(self, tool_timeout: float = 30.0):
         self.tools = {}
+        self.tool_timeout = tool_timeout  # Seconds a single tool call may take
+    
+    @property
+    def tools(self) -> ToolRegistry:
+        """Registered tools by name"""
+        return self._tools
+    
+    @tools.setter
+    def tools(self, tools: Dict[str, Tool]):
+        # Replacing the mapping wholesale must also drop cached definitions
+        self._tools = ToolRegistry(tools)
+        self._cached_defs = None
+        self._cached_version = None
     
     def register_tool(self, tool: Tool):
         """Register any tool that implements the Tool interface"""
@@ -221,9 +316,17 @@ class ToolManager:
         self.tools[tool_name] = tool
 
     
-    def get_tool_definitions(self) -> list:
-        """Get all tool definitions for Anthropic tool calling"""
-        return [tool.get_tool_definition() for tool in self.tools.values()]
+    def get_tool_definitions(self) -> tuple:
+        """
+        Get all tool definitions for Anthropic tool calling.
+        
+        Definitions are rebuilt only after the registered tools change; the
+        returned tuple is shared between calls and must not be mutated.
+        """
+        if self._cached_defs is None or self._cached_version != self._tools.version:
+            self._cached_defs = tuple(tool.get_tool_definition() for tool in self._tools.values())
+            self._cached_version = self._tools.version
+        return self._cached_defs
     
     def execute_tool(self, tool_name: str, **kwargs) -> str:
         """Execute a tool by name with given parameters"""
@@ -232,6 +335,43 @@ class ToolManager:
         
         return self.tools[tool_name].execute(**kwargs)
     
+    async def execute_tool_async(self, tool_name: str, **kwargs) -> str:
+        """Execute a tool by name without blocking the event loop"""
+        if tool_name not in self.tools:
+            return f"Tool '{tool_name}' not found"
+        
+        tool = self.tools[tool_name]
+        
+        # Prefer a native coroutine if the tool provides one
+        execute_async = getattr(tool, 'execute_async', None)
+        if inspect.iscoroutinefunction(execute_async):
+            pending = execute_async(**kwargs)
+        else:
+            # Sync tools (e.g. vector store queries) run on the shared pool
+            loop = asyncio.get_running_loop()
+            # Run in a copy of this context so the call records its sources per request
+            pending = loop.run_in_executor(
+                TOOL_POOL, functools.partial(contextvars.copy_context().run, tool.execute, **kwargs)
+            )
+        
+        # A stuck tool must not hold up the whole response; the worker thread
+        # itself cannot be interrupted and finishes in the background
+        try:
+            return await asyncio.wait_for(pending, timeout=self.tool_timeout)
+        except asyncio.TimeoutError:
+            return timeout_message(tool_name, self.tool_timeout)
+    
+    def sources_context(self) -> contextvars.Context:
+        """
+        Copy of the current context with its own, empty tool sources.
+        
+        Run a query's tool calls and get_last_sources() through context.run()
+        to keep its sources apart from every other query's.
+        """
+        context = contextvars.copy_context()
+        context.run(_request_sources.set, {})
+        return context
+    
     def get_last_sources(self) -> list:
         """Get sources from the last search operation"""
         # Check all tools for last_sources attribute
@@ -0,0 +1,5 @@
+import sys
+import pathlib
+
+# Make the backend modules importable from the tests
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
@@ -0,0 +1,138 @@
+"""Lightweight stand-ins for Anthropic SDK objects and the tool manager"""
+
+import itertools
+from typing import NamedTuple, Sequence
+
+
+class FakeTextBlock(NamedTuple):
+    """Text content block"""
+    text: str
+    type: str = "text"
+
+
+class FakeToolUse(NamedTuple):
+    """tool_use content block"""
+    name: str
+    input: dict
+    id: str
+    type: str = "tool_use"
+
+
+class FakeResponse(NamedTuple):
+    """Message returned by messages.create"""
+    stop_reason: str
+    content: Sequence
+
+
+def text_response(text: str) -> FakeResponse:
+    """Build an end_turn response with a single text block"""
+    return FakeResponse("end_turn", (FakeTextBlock(text),))
+
+
+def tool_use_response(*tool_uses: FakeToolUse) -> FakeResponse:
+    """Build a tool_use response requesting the given tool calls"""
+    return FakeResponse("tool_use", tool_uses)
+
+
+def scripted_turns(tool_calls, answer: str):
+    """
+    Yield one tool_use response per (name, input) pair, then the final answer.
+    
+    Responses are built lazily, one per API turn, so long scripts cost
+    nothing until they are replayed.
+    """
+    for turn, (name, tool_input) in enumerate(tool_calls, start=1):
+        yield tool_use_response(FakeToolUse(name, tool_input, f"tool_{turn}"))
+    yield text_response(answer)
+
+
+class FakeStream:
+    """Context manager returned by messages.stream"""
+    
+    def __init__(self, chunks):
+        self.text_stream = iter(chunks)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        return False
+
+
+class FakeMessages:
+    """messages resource that records calls and replays queued responses"""
+    
+    def __init__(self, responses=(), stream_chunks=()):
+        self.calls = []
+        self.stream_calls = []
+        self._responses = iter(responses)
+        self._stream_chunks = stream_chunks
+    
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        response = next(self._responses)
+        if isinstance(response, Exception):
+            raise response
+        return response
+    
+    def stream(self, **kwargs):
+        self.stream_calls.append(kwargs)
+        return FakeStream(self._stream_chunks)
+
+
+class FakeAsyncMessages(FakeMessages):
+    """Async messages resource; create() may also be replaced by a coroutine function"""
+    
+    async def create(self, **kwargs):
+        return FakeMessages.create(self, **kwargs)
+
+
+class FakeClient:
+    """Anthropic client exposing only the messages resource"""
+    
+    def __init__(self, *responses, script=None, stream_chunks=()):
+        # A script is any iterable of responses, consumed one per call
+        self.messages = FakeMessages(responses if script is None else script, stream_chunks)
+
+
+class FakeAsyncClient:
+    """AsyncAnthropic client exposing only the messages resource"""
+    
+    def __init__(self, *responses):
+        self.messages = FakeAsyncMessages(responses)
+
+
+class FakeToolManager:
+    """
+    Tool manager that records calls and returns results in turn.
+    
+    Results cycle, so a single result is returned for every call. Exception
+    instances are raised instead of returned.
+    """
+    
+    def __init__(self, *results):
+        self.calls = []
+        self._results = itertools.cycle(results)
+    
+    def execute_tool(self, tool_name: str, **kwargs) -> str:
+        self.calls.append((tool_name, kwargs))
+        result = next(self._results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class FakeTool:
+    """Tool with a fixed definition and result that records each execute() call"""
+    
+    def __init__(self, definition: dict, result: str):
+        self.definition = definition
+        self.result = result
+        self.calls = []
+    
+    def get_tool_definition(self) -> dict:
+        return self.definition
+    
+    def execute(self, **kwargs) -> str:
+        self.calls.append(kwargs)
+        return self.result
@@ -1,12 +1,20 @@
+import asyncio
+import threading
 import unittest
-from unittest.mock import Mock, MagicMock, patch, call
-import sys
-import os
+import anthropic
+import httpx
+from anthropic.resources.messages import AsyncBatches
+from types import SimpleNamespace
+from unittest.mock import Mock, create_autospec, patch
 
-# Add parent directory to path for imports
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
-from ai_generator import AIGenerator, ToolCallState
+import ai_generator
+from ai_generator import AIGenerator, ToolCallState, ResponseCache
+from rate_limiter import CircuitOpenError
+from search_tools import ToolManager
+from fakes import (
+    FakeAsyncClient, FakeClient, FakeResponse, FakeTextBlock, FakeTool, FakeToolManager,
+    FakeToolUse, text_response, tool_use_response
+)
 
 
 class TestToolCallState(unittest.TestCase):
@@ -37,9 +45,35 @@ class TestToolCallState(unittest.TestCase):
         state.add_tool_call("search_tool", {"query": "test"}, "result text")
         
         self.assertEqual(len(state.tool_calls_made), 1)
-        self.assertEqual(state.tool_calls_made[0]['tool'], "search_tool")
-        self.assertEqual(state.tool_calls_made[0]['params'], {"query": "test"})
-        self.assertEqual(state.tool_calls_made[0]['result_length'], 11)
+        self.assertEqual(state.tool_calls_made[0].tool, "search_tool")
+        self.assertEqual(state.tool_calls_made[0].params, {"query": "test"})
+        self.assertEqual(state.tool_calls_made[0].result_length, 11)
+        self.assertFalse(hasattr(state.tool_calls_made[0], "__dict__"))
+
+
+class TestResponseCache(unittest.TestCase):
+    """Test the ResponseCache class"""
+    
+    def test_key_depends_on_history_and_tools(self):
+        """Test that history and tool set are part of the key"""
+        tools = [{"name": "search_tool"}]
+        key = ResponseCache.make_key("query", "history", tools)
+        
+        self.assertEqual(key, ResponseCache.make_key("query", "history", [{"name": "search_tool"}]))
+        self.assertNotEqual(key, ResponseCache.make_key("query", None, tools))
+        self.assertNotEqual(key, ResponseCache.make_key("query", "history", None))
+    
+    def test_evicts_least_recently_used(self):
+        """Test LRU eviction once max_size is exceeded"""
+        cache = ResponseCache(max_size=2)
+        cache.set("a", "A")
+        cache.set("b", "B")
+        cache.get("a")
+        cache.set("c", "C")
+        
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get("a"), "A")
+        self.assertIsNone(cache.get("b"))
 
 
 class TestAIGenerator(unittest.TestCase):
@@ -50,20 +84,66 @@ class TestAIGenerator(unittest.TestCase):
         self.api_key = "test-api-key"
         self.model = "claude-3-opus-20240229"
         
-        # Create generator with mocked client
-        with patch('ai_generator.anthropic.Anthropic'):
-            self.generator = AIGenerator(self.api_key, self.model)
-            self.mock_client = Mock()
-            self.generator.client = self.mock_client
+        # Clients are built lazily, so no patching is needed before assigning a fake
+        self.generator = AIGenerator(self.api_key, self.model)
+    
+    def use_responses(self, *responses, stream_chunks=()):
+        """Install a fake client that replays the given responses in order"""
+        self.client = FakeClient(*responses, stream_chunks=stream_chunks)
+        self.generator.client = self.client
+        return self.client.messages
+    
+    def test_clients_share_http_pool(self):
+        """Test that every generator reuses the module-level sync HTTP client"""
+        with patch('ai_generator.anthropic.Anthropic', autospec=True) as mock_sync:
+            for api_key in ("key-1", "key-2"):
+                AIGenerator(api_key, self.model).client
+        
+        self.assertEqual(mock_sync.call_count, 2)
+        for call_args in mock_sync.call_args_list:
+            self.assertIs(call_args[1]["http_client"], ai_generator._HTTP_CLIENT)
+    
+    def test_async_client_per_event_loop(self):
+        """Test that each event loop gets its own async client and HTTP pool"""
+        async def get_clients():
+            return self.generator.async_client, self.generator.async_client
+        
+        first, again = asyncio.run(get_clients())
+        second, _ = asyncio.run(get_clients())
+        
+        # Reused within a loop, never carried over to the next one
+        self.assertIs(first, again)
+        self.assertIsNot(first, second)
+        self.assertIsNot(first._client, second._client)
+        self.assertIsNot(first._client, ai_generator._HTTP_CLIENT)
+    
+    def test_clients_created_lazily(self):
+        """Test that constructing a generator does not build API clients"""
+        with patch('ai_generator.anthropic.Anthropic', autospec=True) as mock_sync, \
+                patch('ai_generator.anthropic.AsyncAnthropic', autospec=True) as mock_async:
+            generator = AIGenerator(self.api_key, self.model)
+            mock_sync.assert_not_called()
+            mock_async.assert_not_called()
+            
+            # Built once, then reused
+            self.assertIs(generator.client, generator.client)
+            mock_sync.assert_called_once_with(
+                api_key=self.api_key, http_client=ai_generator._HTTP_CLIENT, max_retries=2
+            )
+    
+    def test_warmup_accepts_any_http_status(self):
+        """Test that warmup succeeds on an auth error and reports transport failures"""
+        with patch.object(ai_generator, "_HTTP_CLIENT") as http_client:
+            http_client.head.return_value = Mock(status_code=401)
+            self.assertTrue(AIGenerator.warmup())
+            
+            http_client.head.side_effect = httpx.ConnectError("unreachable")
+            with patch("builtins.print"):
+                self.assertFalse(AIGenerator.warmup())
     
     def test_no_tools_needed(self):
         """Test direct response when no tools are needed"""
-        # Mock response without tool use
-        mock_response = Mock()
-        mock_response.stop_reason = "end_turn"
-        mock_response.content = [Mock(text="Direct answer to question")]
-        
-        self.mock_client.messages.create.return_value = mock_response
+        messages = self.use_responses(text_response("Direct answer to question"))
         
         # Call generate_response
         result = self.generator.generate_response(
@@ -76,114 +156,86 @@ class TestAIGenerator(unittest.TestCase):
         self.assertEqual(result, "Direct answer to question")
         
         # Verify only one API call was made
-        self.assertEqual(self.mock_client.messages.create.call_count, 1)
+        self.assertEqual(len(messages.calls), 1)
     
     def test_single_tool_call(self):
         """Test backward compatibility with single tool call"""
-        # Mock tool manager
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.return_value = "Tool result content"
-        
-        # Mock tools
-        mock_tools = [{"name": "search_tool", "description": "Search tool"}]
-        
-        # Mock first response with tool use
-        mock_response1 = Mock()
-        mock_response1.stop_reason = "tool_use"
-        mock_tool_block = Mock()
-        mock_tool_block.type = "tool_use"
-        mock_tool_block.name = "search_tool"
-        mock_tool_block.input = {"query": "test query"}
-        mock_tool_block.id = "tool_123"
-        mock_response1.content = [mock_tool_block]
-        
-        # Mock second response after tool execution (no more tools needed)
-        mock_response2 = Mock()
-        mock_response2.stop_reason = "end_turn"
-        mock_response2.content = [Mock(text="Final answer based on tool results")]
-        
-        # Mock third response (would be final synthesis if Claude used another tool)
-        mock_response3 = Mock()
-        mock_response3.stop_reason = "end_turn"
-        mock_response3.content = [Mock(text="Should not reach here")]
-        
-        # Set up mock to return different responses
-        self.mock_client.messages.create.side_effect = [mock_response1, mock_response2, mock_response3]
+        tool_manager = FakeToolManager("Tool result content")
+        tools = [{"name": "search_tool", "description": "Search tool"}]
+        
+        messages = self.use_responses(
+            tool_use_response(FakeToolUse("search_tool", {"query": "test query"}, "tool_123")),
+            # No more tools needed after the first round
+            text_response("Final answer based on tool results"),
+            # Would be the final synthesis if Claude used another tool
+            text_response("Should not reach here")
+        )
         
         # Call generate_response
         result = self.generator.generate_response(
             query="Search for Python tutorials",
-            tools=mock_tools,
-            tool_manager=mock_tool_manager
+            tools=tools,
+            tool_manager=tool_manager
         )
         
         # Verify result
         self.assertEqual(result, "Final answer based on tool results")
         
         # Verify tool was executed
-        mock_tool_manager.execute_tool.assert_called_once_with(
-            "search_tool", query="test query"
-        )
+        self.assertEqual(tool_manager.calls, [("search_tool", {"query": "test query"})])
         
         # Verify only two API calls were made (not three)
-        self.assertEqual(self.mock_client.messages.create.call_count, 2)
+        self.assertEqual(len(messages.calls), 2)
         
         # Verify second call DOES include tools (can still make another tool call)
-        second_call_args = self.mock_client.messages.create.call_args_list[1][1]
-        self.assertIn("tools", second_call_args)
-        
-        # Verify Claude chose not to use more tools (stop_reason was end_turn)
+        self.assertIn("tools", messages.calls[1])
     
+    
+    def test_lone_tool_call_runs_inline(self):
+        """Test that a single tool_use block runs on the calling thread, not the tool pool"""
+        class ThreadTool(FakeTool):
+            def execute(self, **kwargs) -> str:
+                super().execute(**kwargs)
+                return threading.current_thread().name
+        
+        tool_manager = ToolManager(tool_timeout=30.0)
+        tool_manager.register_tool(ThreadTool({"name": "search_tool"}, None))
+        messages = self.use_responses(
+            # Text before the call still leaves a single tool_use block
+            FakeResponse("tool_use", (
+                FakeTextBlock("Let me search"), FakeToolUse("search_tool", {"query": "q"}, "tool_1")
+            )),
+            text_response("Final answer")
+        )
+        
+        self.generator.generate_response(
+            query="Question", tools=[{"name": "search_tool"}], tool_manager=tool_manager
+        )
+        
+        tool_result = messages.calls[1]["messages"][2]["content"][0]["content"]
+        self.assertEqual(tool_result, threading.current_thread().name)
     def test_sequential_tool_calls(self):
         """Test sequential tool calling with two rounds"""
-        # Mock tool manager
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.side_effect = [
-            "First tool result",
-            "Second tool result"
-        ]
-        
-        # Mock tools
-        mock_tools = [
+        tool_manager = FakeToolManager("First tool result", "Second tool result")
+        tools = [
             {"name": "get_outline", "description": "Get course outline"},
             {"name": "search_content", "description": "Search content"}
         ]
         
-        # Mock first response - first tool call
-        mock_response1 = Mock()
-        mock_response1.stop_reason = "tool_use"
-        mock_tool1 = Mock()
-        mock_tool1.type = "tool_use"
-        mock_tool1.name = "get_outline"
-        mock_tool1.input = {"course": "Python"}
-        mock_tool1.id = "tool_1"
-        mock_response1.content = [mock_tool1]
-        
-        # Mock second response - second tool call based on first results
-        mock_response2 = Mock()
-        mock_response2.stop_reason = "tool_use"
-        mock_tool2 = Mock()
-        mock_tool2.type = "tool_use"
-        mock_tool2.name = "search_content"
-        mock_tool2.input = {"query": "lesson 4 topic"}
-        mock_tool2.id = "tool_2"
-        mock_response2.content = [mock_tool2]
-        
-        # Mock final response after all tools
-        mock_response3 = Mock()
-        mock_response3.stop_reason = "end_turn"
-        mock_response3.content = [Mock(text="Final comprehensive answer")]
-        
-        # Set up mock to return different responses
-        self.mock_client.messages.create.side_effect = [
-            mock_response1, mock_response2, mock_response3
-        ]
+        messages = self.use_responses(
+            # First tool call
+            tool_use_response(FakeToolUse("get_outline", {"course": "Python"}, "tool_1")),
+            # Second tool call based on first results
+            tool_use_response(FakeToolUse("search_content", {"query": "lesson 4 topic"}, "tool_2")),
+            # Final response after all tools
+            text_response("Final comprehensive answer")
+        )
         
         # Call generate_response
         result = self.generator.generate_response(
             query="Find courses similar to lesson 4 of Python course",
-            tools=mock_tools,
-            tool_manager=mock_tool_manager,
+            tools=tools,
+            tool_manager=tool_manager,
             max_tool_rounds=2
         )
         
@@ -191,60 +243,39 @@ class TestAIGenerator(unittest.TestCase):
         self.assertEqual(result, "Final comprehensive answer")
         
         # Verify both tools were executed in sequence
-        self.assertEqual(mock_tool_manager.execute_tool.call_count, 2)
-        mock_tool_manager.execute_tool.assert_any_call("get_outline", course="Python")
-        mock_tool_manager.execute_tool.assert_any_call("search_content", query="lesson 4 topic")
+        self.assertEqual(tool_manager.calls, [
+            ("get_outline", {"course": "Python"}),
+            ("search_content", {"query": "lesson 4 topic"})
+        ])
         
         # Verify three API calls were made
-        self.assertEqual(self.mock_client.messages.create.call_count, 3)
+        self.assertEqual(len(messages.calls), 3)
         
         # Verify first two calls included tools
-        first_call_args = self.mock_client.messages.create.call_args_list[0][1]
-        self.assertIn("tools", first_call_args)
-        
-        second_call_args = self.mock_client.messages.create.call_args_list[1][1]
-        self.assertIn("tools", second_call_args)
+        self.assertIn("tools", messages.calls[0])
+        self.assertIn("tools", messages.calls[1])
         
         # Verify final call did NOT include tools
-        third_call_args = self.mock_client.messages.create.call_args_list[2][1]
-        self.assertNotIn("tools", third_call_args)
+        self.assertNotIn("tools", messages.calls[2])
     
     def test_max_rounds_reached(self):
         """Test that tool calling stops after max rounds"""
-        # Mock tool manager
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.return_value = "Tool result"
-        
-        # Mock tools
-        mock_tools = [{"name": "search_tool", "description": "Search tool"}]
-        
-        # Create responses that always want to use tools
-        mock_tool_response = Mock()
-        mock_tool_response.stop_reason = "tool_use"
-        mock_tool = Mock()
-        mock_tool.type = "tool_use"
-        mock_tool.name = "search_tool"
-        mock_tool.input = {"query": "test"}
-        mock_tool.id = "tool_id"
-        mock_tool_response.content = [mock_tool]
-        
-        # Final response without tools
-        mock_final_response = Mock()
-        mock_final_response.stop_reason = "end_turn"
-        mock_final_response.content = [Mock(text="Final answer after max rounds")]
-        
-        # Set up mock to return tool responses then final
-        self.mock_client.messages.create.side_effect = [
-            mock_tool_response,  # Round 1
-            mock_tool_response,  # Round 2
-            mock_final_response  # Final synthesis
-        ]
+        tool_manager = FakeToolManager("Tool result")
+        tools = [{"name": "search_tool", "description": "Search tool"}]
+        
+        # Responses that always want to use tools, then the final synthesis
+        tool_response = tool_use_response(FakeToolUse("search_tool", {"query": "test"}, "tool_id"))
+        messages = self.use_responses(
+            tool_response,  # Round 1
+            tool_response,  # Round 2
+            text_response("Final answer after max rounds")  # Final synthesis
+        )
         
         # Call with max_tool_rounds=2
         result = self.generator.generate_response(
             query="Complex query",
-            tools=mock_tools,
-            tool_manager=mock_tool_manager,
+            tools=tools,
+            tool_manager=tool_manager,
             max_tool_rounds=2
         )
         
@@ -252,46 +283,81 @@ class TestAIGenerator(unittest.TestCase):
         self.assertEqual(result, "Final answer after max rounds")
         
         # Verify exactly 2 tool executions
-        self.assertEqual(mock_tool_manager.execute_tool.call_count, 2)
+        self.assertEqual(len(tool_manager.calls), 2)
         
         # Verify exactly 3 API calls (2 with tools, 1 without)
-        self.assertEqual(self.mock_client.messages.create.call_count, 3)
+        self.assertEqual(len(messages.calls), 3)
     
-    def test_message_accumulation(self):
-        """Test that messages accumulate correctly across rounds"""
-        # Mock tool manager
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.return_value = "Tool result"
+    def test_tool_use_without_tool_blocks_skips_synthesis(self):
+        """Test that a tool_use stop with no tool blocks returns its text directly"""
+        messages = self.use_responses(
+            FakeResponse("tool_use", [FakeTextBlock("Answer without tools")])
+        )
+        
+        result = self.generator.generate_response(
+            query="Question",
+            tools=[{"name": "search_tool", "description": "Search tool"}],
+            tool_manager=FakeToolManager()
+        )
+        
+        self.assertEqual(result, "Answer without tools")
+        self.assertEqual(len(messages.calls), 1)
+    
+    def test_tool_use_with_text_at_max_rounds(self):
+        """Test that mixed text + tool_use at the last round still gets a synthesis"""
+        tool_manager = FakeToolManager("Tool result")
+        
+        # The text next to a tool call is only a preamble; returning it would
+        # drop the tool result, so the final synthesis call must still happen
+        messages = self.use_responses(
+            tool_use_response(
+                FakeTextBlock("Let me search for that."),
+                FakeToolUse("search_tool", {"query": "test"}, "tool_1")
+            ),
+            text_response("Synthesised answer")
+        )
+        
+        result = self.generator.generate_response(
+            query="Question",
+            tools=[{"name": "search_tool", "description": "Search tool"}],
+            tool_manager=tool_manager,
+            max_tool_rounds=1
+        )
         
-        # Mock tools
-        mock_tools = [{"name": "test_tool", "description": "Test tool"}]
+        self.assertEqual(result, "Synthesised answer")
+        self.assertEqual(tool_manager.calls, [("search_tool", {"query": "test"})])
+        self.assertNotIn("tools", messages.calls[1])
+    
+    def test_end_turn_with_leading_tool_block(self):
+        """Test that text is extracted even when a tool_use block comes first"""
+        self.use_responses(FakeResponse("end_turn", [
+            FakeToolUse("search_tool", {}, "tool_1"),
+            FakeTextBlock("Final text")
+        ]))
         
-        # Mock responses
-        mock_response1 = Mock()
-        mock_response1.stop_reason = "tool_use"
-        mock_tool = Mock()
-        mock_tool.type = "tool_use"
-        mock_tool.name = "test_tool"
-        mock_tool.input = {}
-        mock_tool.id = "tool_1"
-        mock_response1.content = [mock_tool]
+        result = self.generator.generate_response(query="Question")
         
-        mock_response2 = Mock()
-        mock_response2.stop_reason = "end_turn"
-        mock_response2.content = [Mock(text="Final")]
+        self.assertEqual(result, "Final text")
+    
+    def test_message_accumulation(self):
+        """Test that messages accumulate correctly across rounds"""
+        tool_manager = FakeToolManager("Tool result")
+        tools = [{"name": "test_tool", "description": "Test tool"}]
         
-        self.mock_client.messages.create.side_effect = [mock_response1, mock_response2]
+        api_messages = self.use_responses(
+            tool_use_response(FakeToolUse("test_tool", {}, "tool_1")),
+            text_response("Final")
+        )
         
         # Call generate_response
-        result = self.generator.generate_response(
+        self.generator.generate_response(
             query="Test query",
-            tools=mock_tools,
-            tool_manager=mock_tool_manager
+            tools=tools,
+            tool_manager=tool_manager
         )
         
         # Check that second API call has accumulated messages
-        second_call_args = self.mock_client.messages.create.call_args_list[1][1]
-        messages = second_call_args["messages"]
+        messages = api_messages.calls[1]["messages"]
         
         # Should have: user query, assistant tool call, user tool result
         self.assertEqual(len(messages), 3)
@@ -305,57 +371,199 @@ class TestAIGenerator(unittest.TestCase):
     
     def test_error_handling_no_tools_executed(self):
         """Test handling when tool execution fails"""
-        # Mock tool manager that raises an exception
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.side_effect = Exception("Tool error")
-        
-        # Mock tools
-        mock_tools = [{"name": "failing_tool", "description": "Failing tool"}]
-        
-        # Mock response with tool use
-        mock_response1 = Mock()
-        mock_response1.stop_reason = "tool_use"
-        mock_tool = Mock()
-        mock_tool.type = "tool_use"
-        mock_tool.name = "failing_tool"
-        mock_tool.input = {}
-        mock_tool.id = "tool_1"
-        mock_response1.content = [mock_tool]
-        
-        # Mock final response
-        mock_response2 = Mock()
-        mock_response2.stop_reason = "end_turn"
-        mock_response2.content = [Mock(text="Fallback response")]
-        
-        self.mock_client.messages.create.side_effect = [mock_response1, mock_response2]
-        
-        # Call should handle the error gracefully
+        tool_manager = FakeToolManager(Exception("Tool error"))
+        tools = [{"name": "failing_tool", "description": "Failing tool"}]
+        
+        self.use_responses(
+            tool_use_response(FakeToolUse("failing_tool", {}, "tool_1")),
+            text_response("Fallback response")
+        )
+        
+        # The tool error propagates to the caller
         with self.assertRaises(Exception):
-            result = self.generator.generate_response(
+            self.generator.generate_response(
                 query="Test query",
-                tools=mock_tools,
-                tool_manager=mock_tool_manager
+                tools=tools,
+                tool_manager=tool_manager
+            )
+    
+    def test_repeated_query_served_from_cache(self):
+        """Test that an identical request without tools skips the API"""
+        messages = self.use_responses(text_response("Cached answer"))
+        
+        first = self.generator.generate_response(query="What is Python?")
+        second = self.generator.generate_response(query="What is Python?")
+        
+        self.assertEqual(first, "Cached answer")
+        self.assertEqual(second, "Cached answer")
+        self.assertEqual(len(messages.calls), 1)
+    
+    def test_tool_requests_bypass_cache_unless_forced(self):
+        """Test that tool-backed requests are only cached with cache='force'"""
+        messages = self.use_responses(*[text_response("Answer")] * 3)
+        
+        tool_manager = FakeToolManager()
+        tools = [{"name": "search_tool", "description": "Search tool"}]
+        
+        for _ in range(2):
+            self.generator.generate_response(
+                query="Search", tools=tools, tool_manager=tool_manager
+            )
+        self.assertEqual(len(messages.calls), 2)
+        
+        for _ in range(2):
+            self.generator.generate_response(
+                query="Search", tools=tools, tool_manager=tool_manager, cache="force"
             )
+        self.assertEqual(len(messages.calls), 3)
+    
+    def test_stream_direct_answer(self):
+        """Test streaming when Claude answers without tools"""
+        messages = self.use_responses(text_response("Direct answer"))
+        
+        chunks = list(self.generator.generate_response_stream(query="What is Python?"))
+        
+        self.assertEqual(chunks, ["Direct answer"])
+        self.assertEqual(messages.stream_calls, [])
+    
+    def test_stream_final_synthesis(self):
+        """Test that the synthesis after tool rounds is streamed without tools"""
+        tool_manager = FakeToolManager("Tool result")
+        tools = [{"name": "search_tool", "description": "Search tool"}]
+        
+        tool_response = tool_use_response(FakeToolUse("search_tool", {"query": "test"}, "tool_id"))
+        messages = self.use_responses(
+            tool_response, tool_response,
+            stream_chunks=["Final ", "streamed ", "answer"]
+        )
+        
+        chunks = list(self.generator.generate_response_stream(
+            query="Complex query",
+            tools=tools,
+            tool_manager=tool_manager,
+            max_tool_rounds=2
+        ))
+        
+        self.assertEqual(chunks, ["Final ", "streamed ", "answer"])
+        self.assertEqual(len(messages.calls), 2)
+        stream_args = messages.stream_calls[0]
+        self.assertNotIn("tools", stream_args)
+        self.assertEqual(len(stream_args["messages"]), 5)
+    
+    def test_circuit_opens_on_repeated_upstream_failures(self):
+        """Test that sustained connection failures stop reaching the API"""
+        request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+        threshold = self.generator.circuit_breaker.failure_threshold
+        messages = self.use_responses(*[anthropic.APIConnectionError(request=request)] * (threshold + 1))
+        
+        for _ in range(threshold):
+            with self.assertRaises(anthropic.APIConnectionError):
+                self.generator.generate_response(query="Question", cache=False)
+        
+        with self.assertRaises(CircuitOpenError):
+            self.generator.generate_response(query="Question", cache=False)
+        self.assertEqual(len(messages.calls), threshold)
     
     def test_conversation_history_preserved(self):
         """Test that conversation history is included in all API calls"""
         history = "User: Previous question\nAssistant: Previous answer"
-        
-        # Mock response without tools
-        mock_response = Mock()
-        mock_response.stop_reason = "end_turn"
-        mock_response.content = [Mock(text="Answer")]
-        
-        self.mock_client.messages.create.return_value = mock_response
+        messages = self.use_responses(text_response("Answer"))
         
         # Call with conversation history
-        result = self.generator.generate_response(
+        self.generator.generate_response(
             query="New question",
             conversation_history=history
         )
         
-        # Verify system prompt includes history
-        call_args = self.mock_client.messages.create.call_args[1]
+        # Verify system prompt includes history after the cached static block
+        call_args = messages.calls[0]
+        self.assertEqual(call_args["system"][0]["text"], AIGenerator.SYSTEM_PROMPT)
+        self.assertIn(history, call_args["system"][1]["text"])
+    
+    def test_history_trimmed_to_window(self):
+        """Test that only the last history_window exchanges reach the prompt"""
+        self.generator.history_window = 1
+        history = (
+            "User: First question\n"
+            "Assistant: First answer\nspanning two lines\n"
+            "User: Second question\n"
+            "Assistant: Second answer"
+        )
+        
+        windowed = self.generator._windowed_history(history)
+        
+        self.assertEqual(windowed, "User: Second question\nAssistant: Second answer")
+    
+    def test_history_within_window_unchanged(self):
+        """Test that short history is passed through as-is"""
+        history = "User: Question\nAssistant: Answer\nwith a second line"
+        self.assertIs(self.generator._windowed_history(history), history)
+    
+    def test_history_as_message_list(self):
+        """Test that list-of-dict history is windowed and formatted"""
+        self.generator.history_window = 1
+        history = [
+            {"role": "user", "content": "Old question"},
+            {"role": "assistant", "content": "Old answer"},
+            {"role": "user", "content": "New question"},
+            {"role": "assistant", "content": "New answer"},
+        ]
+        
+        windowed = self.generator._windowed_history(history)
+        
+        self.assertEqual(windowed, "User: New question\nAssistant: New answer")
+    
+    def test_prompt_caching_breakpoints(self):
+        """Test cache_control on the static system block and the last tool"""
+        messages = self.use_responses(text_response("Answer"))
+        tools = [
+            {"name": "get_outline", "description": "Get course outline"},
+            {"name": "search_content", "description": "Search content"}
+        ]
+        
+        self.generator.generate_response(
+            query="New question",
+            conversation_history="User: Hi\nAssistant: Hello",
+            tools=tools,
+            tool_manager=FakeToolManager()
+        )
+        
+        call_args = messages.calls[0]
+        self.assertEqual(call_args["system"][0]["cache_control"], {"type": "ephemeral"})
+        self.assertNotIn("cache_control", call_args["system"][1])
+        self.assertNotIn("cache_control", call_args["tools"][0])
+        self.assertEqual(call_args["tools"][1]["cache_control"], {"type": "ephemeral"})
+        
+        # Caller's tool definitions are not mutated
+        self.assertNotIn("cache_control", tools[1])
+    
+    def test_static_system_block_reused(self):
+        """Test that the static system block is built once and shared across requests"""
+        without_history = self.generator._build_system(None)
+        with_history = self.generator._build_system("User: Hi\nAssistant: Hello")
+        
+        self.assertIs(without_history, self.generator._build_system(None))
+        self.assertIs(with_history[0], without_history[0])
+    
+    def test_system_with_history_memoised(self):
+        """Test that the same history string reuses the built system content"""
+        history = "User: Hi\nAssistant: Hello"
+        first = self.generator._build_system(history)
+        
+        self.assertIs(self.generator._build_system(history), first)
+        self.assertIsNot(self.generator._build_system(history + "\nUser: More"), first)
+        self.assertEqual(self.generator._system_for_history.cache_info().hits, 1)
+    
+    def test_prompt_caching_disabled(self):
+        """Test that disabling prompt caching sends a plain system string"""
+        self.generator = AIGenerator(self.api_key, self.model, prompt_caching=False)
+        messages = self.use_responses(text_response("Answer"))
+        
+        history = "User: Previous question\nAssistant: Previous answer"
+        self.generator.generate_response(query="New question", conversation_history=history)
+        
+        call_args = messages.calls[0]
+        self.assertIsInstance(call_args["system"], str)
         self.assertIn(history, call_args["system"])
 
 
@@ -364,122 +572,282 @@ class TestComplexScenarios(unittest.TestCase):
     
     def setUp(self):
         """Set up test fixtures"""
-        with patch('ai_generator.anthropic.Anthropic'):
-            self.generator = AIGenerator("test-key", "test-model")
-            self.mock_client = Mock()
-            self.generator.client = self.mock_client
+        self.generator = AIGenerator("test-key", "test-model")
     
     def test_course_comparison_scenario(self):
         """Test comparing two courses using sequential tool calls"""
-        # Mock tool manager
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.side_effect = [
+        tool_manager = FakeToolManager(
             "MCP Course Outline: Lesson 1: Intro, Lesson 2: Basics...",
             "Computer Use Course Outline: Lesson 1: Setup, Lesson 2: Navigation..."
-        ]
+        )
+        tools = [{"name": "get_course_outline", "description": "Get course outline"}]
         
-        # Mock tools
-        mock_tools = [{"name": "get_course_outline", "description": "Get course outline"}]
-        
-        # Mock responses for two sequential outline calls
-        mock_response1 = Mock()
-        mock_response1.stop_reason = "tool_use"
-        tool1 = Mock()
-        tool1.type = "tool_use"
-        tool1.name = "get_course_outline"
-        tool1.input = {"course_title": "MCP"}
-        tool1.id = "tool_1"
-        mock_response1.content = [tool1]
-        
-        mock_response2 = Mock()
-        mock_response2.stop_reason = "tool_use"
-        tool2 = Mock()
-        tool2.type = "tool_use"
-        tool2.name = "get_course_outline"
-        tool2.input = {"course_title": "Computer Use"}
-        tool2.id = "tool_2"
-        mock_response2.content = [tool2]
-        
-        mock_final = Mock()
-        mock_final.stop_reason = "end_turn"
-        mock_final.content = [Mock(text="Both courses cover similar introductory topics...")]
-        
-        self.mock_client.messages.create.side_effect = [
-            mock_response1, mock_response2, mock_final
-        ]
+        # Two sequential outline calls, then the synthesis
+        self.generator.client = FakeClient(
+            tool_use_response(FakeToolUse("get_course_outline", {"course_title": "MCP"}, "tool_1")),
+            tool_use_response(FakeToolUse("get_course_outline", {"course_title": "Computer Use"}, "tool_2")),
+            text_response("Both courses cover similar introductory topics...")
+        )
         
         # Execute the comparison
         result = self.generator.generate_response(
             query="How does the MCP introduction compare to the Computer Use course structure?",
-            tools=mock_tools,
-            tool_manager=mock_tool_manager
+            tools=tools,
+            tool_manager=tool_manager
         )
         
         # Verify both outlines were retrieved
-        self.assertEqual(mock_tool_manager.execute_tool.call_count, 2)
+        self.assertEqual(len(tool_manager.calls), 2)
         
         # Verify final synthesis
         self.assertIn("similar introductory topics", result)
     
     def test_find_specific_then_search_scenario(self):
         """Test finding specific lesson then searching for related content"""
-        # Mock tool manager
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.side_effect = [
+        tool_manager = FakeToolManager(
             "Course: Python Basics\nLesson 4: Object-Oriented Programming",
             "Found 3 courses discussing OOP: Java Advanced, C++ Fundamentals, Ruby Design"
-        ]
-        
-        # Mock tools
-        mock_tools = [
+        )
+        tools = [
             {"name": "get_course_outline", "description": "Get outline"},
             {"name": "search_course_content", "description": "Search content"}
         ]
         
-        # First call gets outline
-        mock_response1 = Mock()
-        mock_response1.stop_reason = "tool_use"
-        tool1 = Mock()
-        tool1.type = "tool_use"
-        tool1.name = "get_course_outline"
-        tool1.input = {"course_title": "Python Basics"}
-        tool1.id = "tool_1"
-        mock_response1.content = [tool1]
-        
-        # Second call searches based on lesson 4 topic
-        mock_response2 = Mock()
-        mock_response2.stop_reason = "tool_use"
-        tool2 = Mock()
-        tool2.type = "tool_use"
-        tool2.name = "search_course_content"
-        tool2.input = {"query": "Object-Oriented Programming"}
-        tool2.id = "tool_2"
-        mock_response2.content = [tool2]
-        
-        # Final synthesis
-        mock_final = Mock()
-        mock_final.stop_reason = "end_turn"
-        mock_final.content = [Mock(text="Courses covering similar OOP topics: Java Advanced, C++ Fundamentals, Ruby Design")]
-        
-        self.mock_client.messages.create.side_effect = [
-            mock_response1, mock_response2, mock_final
-        ]
+        self.generator.client = FakeClient(
+            # First call gets outline
+            tool_use_response(FakeToolUse("get_course_outline", {"course_title": "Python Basics"}, "tool_1")),
+            # Second call searches based on lesson 4 topic
+            tool_use_response(FakeToolUse("search_course_content", {"query": "Object-Oriented Programming"}, "tool_2")),
+            # Final synthesis
+            text_response("Courses covering similar OOP topics: Java Advanced, C++ Fundamentals, Ruby Design")
+        )
         
         # Execute the complex query
         result = self.generator.generate_response(
             query="Find courses that discuss the same topic as lesson 4 of Python Basics",
-            tools=mock_tools,
-            tool_manager=mock_tool_manager
+            tools=tools,
+            tool_manager=tool_manager
         )
         
         # Verify the sequence
-        calls = mock_tool_manager.execute_tool.call_args_list
-        self.assertEqual(calls[0][0][0], "get_course_outline")
-        self.assertEqual(calls[1][0][0], "search_course_content")
+        self.assertEqual(
+            [name for name, _ in tool_manager.calls],
+            ["get_course_outline", "search_course_content"]
+        )
         
         # Verify final result mentions the found courses
         self.assertIn("Java Advanced", result)
 
 
-if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+class TestAsyncGeneration(unittest.IsolatedAsyncioTestCase):
+    """Test the async generation path with concurrent tool execution"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        self.generator = AIGenerator("test-key", "test-model")
+    
+    def use_responses(self, *responses):
+        """Install a fake async client that replays the given responses in order"""
+        self.async_client = FakeAsyncClient(*responses)
+        self.generator.async_client = self.async_client
+        return self.async_client.messages
+    
+    async def test_no_tools_needed(self):
+        """Test direct response via the async client"""
+        messages = self.use_responses(text_response("Async answer"))
+        
+        result = await self.generator.generate_response_async(query="What is Python?")
+        
+        self.assertEqual(result, "Async answer")
+        self.assertEqual(len(messages.calls), 1)
+    
+    async def test_single_tool_call(self):
+        """Test that a lone tool_use block is executed and its result sent back"""
+        calls = []
+        
+        async def execute_tool_async(name, **kwargs):
+            calls.append((name, kwargs))
+            return "Tool result"
+        
+        api_messages = self.use_responses(
+            tool_use_response(FakeToolUse("search_tool", {"query": "test"}, "tool_1")),
+            text_response("Final answer")
+        )
+        
+        result = await self.generator.generate_response_async(
+            query="Question",
+            tools=[{"name": "search_tool", "description": "Search tool"}],
+            tool_manager=SimpleNamespace(execute_tool_async=execute_tool_async)
+        )
+        
+        self.assertEqual(result, "Final answer")
+        self.assertEqual(calls, [("search_tool", {"query": "test"})])
+        self.assertEqual(api_messages.calls[1]["messages"][2]["content"], [
+            {"type": "tool_result", "tool_use_id": "tool_1", "content": "Tool result"}
+        ])
+    
+    async def test_tools_in_same_round_run_concurrently(self):
+        """Test that multiple tool_use blocks in one response execute concurrently"""
+        # Both tools must be in flight at once for the barrier to release
+        barrier = asyncio.Barrier(2)
+        
+        async def execute_tool_async(name, **kwargs):
+            await asyncio.wait_for(barrier.wait(), timeout=1)
+            return f"{name} result"
+        
+        tool_manager = SimpleNamespace(execute_tool_async=execute_tool_async)
+        tools = [
+            {"name": "get_outline", "description": "Get course outline"},
+            {"name": "search_content", "description": "Search content"}
+        ]
+        
+        api_messages = self.use_responses(
+            tool_use_response(
+                FakeToolUse("get_outline", {"course": "Python"}, "tool_1"),
+                FakeToolUse("search_content", {"query": "lesson 4"}, "tool_2")
+            ),
+            text_response("Combined answer")
+        )
+        
+        result = await self.generator.generate_response_async(
+            query="Compare outline and content",
+            tools=tools,
+            tool_manager=tool_manager
+        )
+        
+        self.assertEqual(result, "Combined answer")
+        
+        # Tool results keep the order of the tool_use blocks
+        messages = api_messages.calls[1]["messages"]
+        tool_results = messages[2]["content"]
+        self.assertEqual([r["tool_use_id"] for r in tool_results], ["tool_1", "tool_2"])
+        self.assertEqual(tool_results[0]["content"], "get_outline result")
+        self.assertEqual(tool_results[1]["content"], "search_content result")
+    
+    async def test_identical_concurrent_requests_share_one_call(self):
+        """Test that identical in-flight requests are coalesced into one API call"""
+        release = asyncio.Event()
+        calls = 0
+        
+        async def create(**kwargs):
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return text_response("Shared answer")
+        
+        self.use_responses().create = create
+        
+        pending = [
+            asyncio.ensure_future(self.generator.generate_response_async(query="What is MCP?"))
+            for _ in range(3)
+        ]
+        await asyncio.sleep(0)
+        release.set()
+        
+        self.assertEqual(await asyncio.gather(*pending), ["Shared answer"] * 3)
+        self.assertEqual(calls, 1)
+        self.assertEqual(self.generator._inflight, {})
+    
+    async def test_coalesced_failure_reaches_every_caller(self):
+        """Test that an error is raised to all waiters and the request can be retried"""
+        messages = self.use_responses(RuntimeError("upstream"), text_response("Recovered"))
+        
+        results = await asyncio.gather(
+            self.generator.generate_response_async(query="Question"),
+            self.generator.generate_response_async(query="Question"),
+            return_exceptions=True
+        )
+        
+        self.assertTrue(all(isinstance(r, RuntimeError) for r in results))
+        self.assertEqual(await self.generator.generate_response_async(query="Question"), "Recovered")
+        self.assertEqual(len(messages.calls), 2)
+    
+    async def test_tool_requests_not_coalesced(self):
+        """Test that tool-backed requests each make their own call"""
+        messages = self.use_responses(text_response("First"), text_response("Second"))
+        tools = [{"name": "search_tool", "description": "Search tool"}]
+        tool_manager = SimpleNamespace()
+        
+        results = await asyncio.gather(*[
+            self.generator.generate_response_async(query="Search", tools=tools, tool_manager=tool_manager)
+            for _ in range(2)
+        ])
+        
+        self.assertEqual(sorted(results), ["First", "Second"])
+        self.assertEqual(len(messages.calls), 2)
+    
+    async def test_batch_api_results_in_query_order(self):
+        """Test that batch results are polled and mapped back by custom_id"""
+        # Autospec checks every call against the SDK's real method signatures
+        self.use_responses()
+        batches = self.async_client.messages.batches = create_autospec(AsyncBatches, instance=True)
+        batches.create.return_value = Mock(id="batch_1", processing_status="in_progress")
+        batches.retrieve.return_value = Mock(id="batch_1", processing_status="ended")
+        
+        def batch_entry(custom_id, text):
+            message = FakeResponse("end_turn", (FakeTextBlock(text),))
+            return SimpleNamespace(
+                custom_id=custom_id, result=SimpleNamespace(type="succeeded", message=message)
+            )
+        
+        async def results():
+            # Batch results are not guaranteed to come back in request order
+            yield batch_entry("q1", "Second answer")
+            yield batch_entry("q0", "First answer")
+        
+        batches.results.return_value = results()
+        
+        responses = await self.generator.generate_responses_batch(
+            ["First question", "Second question"], poll_interval=0
+        )
+        
+        self.assertEqual(responses, ["First answer", "Second answer"])
+        requests = batches.create.call_args[1]["requests"]
+        self.assertEqual([r["custom_id"] for r in requests], ["q0", "q1"])
+        self.assertEqual(requests[1]["params"]["messages"][0]["content"], "Second question")
+        batches.retrieve.assert_awaited_once_with("batch_1")
+    
+    async def test_empty_batch_makes_no_requests(self):
+        """Test that an empty batch returns immediately without submitting anything"""
+        self.use_responses()
+        batches = self.async_client.messages.batches = create_autospec(AsyncBatches, instance=True)
+        
+        self.assertEqual(await self.generator.generate_responses_batch([]), [])
+        batches.create.assert_not_called()
+    
+    async def test_batch_api_respects_circuit_breaker(self):
+        """Test that batch submissions are rejected while the circuit is open"""
+        self.use_responses()
+        batches = self.async_client.messages.batches = create_autospec(AsyncBatches, instance=True)
+        request = httpx.Request("POST", "https://api.anthropic.com/v1/messages/batches")
+        batches.create.side_effect = anthropic.APIConnectionError(request=request)
+        
+        for _ in range(self.generator.circuit_breaker.failure_threshold):
+            with self.assertRaises(anthropic.APIConnectionError):
+                await self.generator.generate_responses_batch(["Question"])
+        
+        with self.assertRaises(CircuitOpenError):
+            await self.generator.generate_responses_batch(["Question"])
+        self.assertEqual(batches.create.await_count, self.generator.circuit_breaker.failure_threshold)
+    
+    async def test_batch_without_batch_api_limits_concurrency(self):
+        """Test the concurrent fallback path respects max_concurrency"""
+        in_flight = 0
+        peak = 0
+        
+        async def create(**kwargs):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0)
+            in_flight -= 1
+            return text_response(kwargs["messages"][0]["content"].upper())
+        
+        self.use_responses().create = create
+        
+        responses = await self.generator.generate_responses_batch(
+            ["a", "b", "c", "d"], use_batch_api=False, max_concurrency=2
+        )
+        
+        self.assertEqual(responses, ["A", "B", "C", "D"])
+        self.assertLessEqual(peak, 2)
@@ -1,209 +1,276 @@
-#!/usr/bin/env python
 """Integration test to verify sequential tool calling works end-to-end"""
 
-import sys
-import os
-from unittest.mock import Mock, patch
+import threading
+from types import MappingProxyType
 
-# Add parent directory to path
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
 
 from ai_generator import AIGenerator, ToolCallState
 from search_tools import ToolManager
+from fakes import (
+    FakeClient, FakeTool, FakeToolUse, scripted_turns, text_response, tool_use_response
+)
 
 
-def test_sequential_tool_execution():
-    """Test that the system can handle sequential tool calls properly"""
-    
-    # Create a mock tool manager
-    tool_manager = ToolManager()
-    
-    # Mock tool 1 - get course outline
-    mock_outline_tool = Mock()
-    mock_outline_tool.get_tool_definition.return_value = {
-        "name": "get_course_outline",
-        "description": "Get course outline",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "course_title": {"type": "string"}
-            },
-            "required": ["course_title"]
-        }
-    }
-    mock_outline_tool.execute.return_value = """
-    Course Title: Python Basics
-    Lessons:
-      Lesson 1: Introduction
-      Lesson 2: Variables and Types
-      Lesson 3: Control Flow
-      Lesson 4: Object-Oriented Programming
-      Lesson 5: Advanced Topics
-    """
-    
-    # Mock tool 2 - search content
-    mock_search_tool = Mock()
-    mock_search_tool.get_tool_definition.return_value = {
-        "name": "search_course_content",
-        "description": "Search course content",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "query": {"type": "string"}
-            },
-            "required": ["query"]
-        }
+def _freeze(value):
+    """Recursively make a schema read-only: dicts become proxies, lists tuples"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+# Tool schemas are pure data, shared read-only by every test (and xdist worker)
+OUTLINE_SCHEMA = _freeze({
+    "name": "get_course_outline",
+    "description": "Get course outline",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "course_title": {"type": "string"}
+        },
+        "required": ["course_title"]
     }
-    mock_search_tool.execute.return_value = """
-    Found 3 courses discussing Object-Oriented Programming:
-    - Java Advanced: Full OOP implementation
-    - C++ Fundamentals: Classes and inheritance
-    - Ruby Design Patterns: OOP best practices
-    """
-    
-    # Register mock tools
-    tool_manager.tools = {
-        "get_course_outline": mock_outline_tool,
-        "search_course_content": mock_search_tool
+})
+
+SEARCH_SCHEMA = _freeze({
+    "name": "search_course_content",
+    "description": "Search course content",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "query": {"type": "string"}
+        },
+        "required": ["query"]
     }
+})
+
+
+# Canned tool output returned by the fake tools
+OUTLINE_RESULT = """
+Course Title: Python Basics
+Lessons:
+  Lesson 1: Introduction
+  Lesson 2: Variables and Types
+  Lesson 3: Control Flow
+  Lesson 4: Object-Oriented Programming
+  Lesson 5: Advanced Topics
+"""
+
+SEARCH_RESULT = """
+Found 3 courses discussing Object-Oriented Programming:
+- Java Advanced: Full OOP implementation
+- C++ Fundamentals: Classes and inheritance
+- Ruby Design Patterns: OOP best practices
+"""
+
+
+@pytest.fixture(scope="module")
+def tool_manager():
+    """Tool manager with fake outline and search tools, shared by the module"""
+    manager = ToolManager()
     
-    # Create AI generator with mock API key
-    generator = AIGenerator("test-key", "claude-3-opus-20240229")
-    
-    # Mock the Anthropic client
-    mock_client = Mock()
-    generator.client = mock_client
-    
-    # Mock response 1: Get outline
-    mock_response1 = Mock()
-    mock_response1.stop_reason = "tool_use"
-    tool_call1 = Mock()
-    tool_call1.type = "tool_use"
-    tool_call1.name = "get_course_outline"
-    tool_call1.input = {"course_title": "Python Basics"}
-    tool_call1.id = "tool_1"
-    mock_response1.content = [tool_call1]
-    
-    # Mock response 2: Search based on lesson 4
-    mock_response2 = Mock()
-    mock_response2.stop_reason = "tool_use"
-    tool_call2 = Mock()
-    tool_call2.type = "tool_use"
-    tool_call2.name = "search_course_content"
-    tool_call2.input = {"query": "Object-Oriented Programming"}
-    tool_call2.id = "tool_2"
-    mock_response2.content = [tool_call2]
-    
-    # Mock final response
-    mock_final = Mock()
-    mock_final.stop_reason = "end_turn"
-    mock_final.content = [Mock(text="Based on lesson 4 of Python Basics (Object-Oriented Programming), I found similar content in Java Advanced, C++ Fundamentals, and Ruby Design Patterns courses.")]
-    
-    # Set up the mock sequence
-    mock_client.messages.create.side_effect = [mock_response1, mock_response2, mock_final]
-    
-    # Test query that requires sequential tool calls
-    query = "Find courses that cover similar topics to lesson 4 of Python Basics"
+    # Tool 1 - get course outline
+    manager.register_tool(FakeTool(OUTLINE_SCHEMA, OUTLINE_RESULT))
+    
+    # Tool 2 - search content
+    manager.register_tool(FakeTool(SEARCH_SCHEMA, SEARCH_RESULT))
+    
+    return manager
+
+
+@pytest.fixture(scope="module")
+def tool_defs(tool_manager):
+    """Tool definitions sent with every request"""
+    return tool_manager.get_tool_definitions()
+
+
+@pytest.fixture(scope="module")
+def generator():
+    """AI generator with a fake API key; tests swap in a fake client"""
+    return AIGenerator("test-key", "claude-3-opus-20240229")
+
+
+@pytest.fixture(autouse=True)
+def reset_tool_calls(tool_manager):
+    """Start every test with empty tool call records"""
+    for tool in tool_manager.tools.values():
+        tool.calls.clear()
+
+
+@pytest.mark.parametrize("tool_sequence,answer,expected_calls", [
+    pytest.param(
+        [
+            ("get_course_outline", {"course_title": "Python Basics"}),
+            ("search_course_content", {"query": "Object-Oriented Programming"})
+        ],
+        "Based on lesson 4 of Python Basics (Object-Oriented Programming), I found similar content in Java Advanced, C++ Fundamentals, and Ruby Design Patterns courses.",
+        3,
+        id="sequential"
+    ),
+    # Backward compatibility - single tool calls still work
+    pytest.param(
+        [("search_course_content", {"query": "Python"})],
+        "I found 5 courses about Python.",
+        2,
+        id="single"
+    ),
+])
+def test_tool_execution(generator, tool_manager, tool_defs, monkeypatch,
+                        tool_sequence, answer, expected_calls):
+    """Test that each scripted tool call runs in order before the final answer"""
+    # Fake Anthropic client replaying one tool_use turn per call, then the answer
+    fake_client = FakeClient(script=scripted_turns(tool_sequence, answer))
+    monkeypatch.setattr(generator, "client", fake_client)
+    api_calls = fake_client.messages.calls
     
     # Execute
     result = generator.generate_response(
-        query=query,
-        tools=tool_manager.get_tool_definitions(),
+        query="Find courses that cover similar topics to lesson 4 of Python Basics",
+        tools=tool_defs,
         tool_manager=tool_manager,
         max_tool_rounds=2
     )
     
     # Verify the result
-    print("Query:", query)
-    print("Result:", result)
-    
-    # Verify both tools were called
-    assert mock_outline_tool.execute.called, "Outline tool should have been called"
-    assert mock_search_tool.execute.called, "Search tool should have been called"
+    assert result == answer
     
-    # Verify the sequence
-    assert mock_outline_tool.execute.call_args[1]["course_title"] == "Python Basics"
-    assert mock_search_tool.execute.call_args[1]["query"] == "Object-Oriented Programming"
+    # Verify each tool was called with the scripted input
+    for name, tool_input in tool_sequence:
+        assert tool_manager.tools[name].calls == [tool_input], f"{name} should have been called"
     
-    # Verify we made 3 API calls total
-    assert mock_client.messages.create.call_count == 3, f"Expected 3 API calls, got {mock_client.messages.create.call_count}"
+    # Verify the number of API calls (one per tool round plus the final answer)
+    assert len(api_calls) == expected_calls, f"Expected {expected_calls} API calls, got {len(api_calls)}"
     
-    print("\n[PASS] Integration test passed! Sequential tool calling is working correctly.")
-    print(f"   - Made {mock_client.messages.create.call_count} API calls")
-    print(f"   - Executed {mock_outline_tool.execute.call_count + mock_search_tool.execute.call_count} tool calls")
+    # Tool output is passed to the API as-is
+    expected_results = {"get_course_outline": OUTLINE_RESULT, "search_course_content": SEARCH_RESULT}
+    sent_results = [
+        message["content"][0]["content"]
+        for message in api_calls[-1]["messages"]
+        if message["role"] == "user" and isinstance(message["content"], list)
+    ]
+    assert sent_results == [expected_results[name] for name, _ in tool_sequence]
     
-    return True
+    # Tool results were sent back in the order the tools were requested
+    tool_result_ids = [
+        message["content"][0]["tool_use_id"]
+        for message in api_calls[-1]["messages"]
+        if message["role"] == "user" and isinstance(message["content"], list)
+    ]
+    assert tool_result_ids == [f"tool_{turn}" for turn in range(1, len(tool_sequence) + 1)]
 
 
-def test_single_tool_still_works():
-    """Ensure backward compatibility - single tool calls still work"""
+def test_parallel_tool_execution(generator, monkeypatch):
+    """Test that several tool_use blocks in one response run concurrently"""
+    # Each tool waits for the other, so the barrier only releases if both run at once
+    barrier = threading.Barrier(2, timeout=1)
+    fake_client = FakeClient(
+        tool_use_response(
+            FakeToolUse("get_course_outline", {"course_title": "Python Basics"}, "tool_1"),
+            FakeToolUse("search_course_content", {"query": "Object-Oriented Programming"}, "tool_2")
+        ),
+        text_response("Lesson 4 covers OOP, like Java Advanced and C++ Fundamentals.")
+    )
+    monkeypatch.setattr(generator, "client", fake_client)
     
-    # Create a mock tool manager
-    tool_manager = ToolManager()
+    api_calls_seen = []
     
-    # Mock a single search tool
-    mock_search_tool = Mock()
-    mock_search_tool.get_tool_definition.return_value = {
-        "name": "search_course_content",
-        "description": "Search course content",
-        "input_schema": {
-            "type": "object",
-            "properties": {
-                "query": {"type": "string"}
-            },
-            "required": ["query"]
-        }
-    }
-    mock_search_tool.execute.return_value = "Found 5 courses about Python"
+    class BarrierTool(FakeTool):
+        def execute(self, **kwargs) -> str:
+            barrier.wait()
+            api_calls_seen.append(len(fake_client.messages.calls))
+            return super().execute(**kwargs)
     
-    tool_manager.tools = {"search_course_content": mock_search_tool}
+    tool_manager = ToolManager()
+    tool_manager.register_tool(BarrierTool(OUTLINE_SCHEMA, "Lesson 4: Object-Oriented Programming"))
+    tool_manager.register_tool(BarrierTool(SEARCH_SCHEMA, "Java Advanced, C++ Fundamentals"))
     
-    # Create AI generator
-    generator = AIGenerator("test-key", "claude-3-opus-20240229")
-    mock_client = Mock()
-    generator.client = mock_client
+    result = generator.generate_response(
+        query="Which courses cover the topic of lesson 4 of Python Basics?",
+        tools=tool_manager.get_tool_definitions(),
+        tool_manager=tool_manager
+    )
     
-    # Mock single tool use then done
-    mock_response1 = Mock()
-    mock_response1.stop_reason = "tool_use"
-    tool_call = Mock()
-    tool_call.type = "tool_use"
-    tool_call.name = "search_course_content"
-    tool_call.input = {"query": "Python"}
-    tool_call.id = "tool_1"
-    mock_response1.content = [tool_call]
+    assert result == "Lesson 4 covers OOP, like Java Advanced and C++ Fundamentals."
     
-    mock_response2 = Mock()
-    mock_response2.stop_reason = "end_turn"
-    mock_response2.content = [Mock(text="I found 5 courses about Python.")]
+    # Both tools ran between the first and second API calls
+    assert api_calls_seen == [1, 1]
+    assert len(fake_client.messages.calls) == 2
     
-    mock_client.messages.create.side_effect = [mock_response1, mock_response2]
+    # Results are sent back in the order of the tool_use blocks
+    tool_results = fake_client.messages.calls[1]["messages"][2]["content"]
+    assert [r["tool_use_id"] for r in tool_results] == ["tool_1", "tool_2"]
+    assert tool_results[0]["content"] == "Lesson 4: Object-Oriented Programming"
+
+
+@pytest.mark.parametrize("history", [None, "User: What is MCP?\nAssistant: A protocol for tools."])
+def test_system_prompt_cached_across_turns(generator, tool_manager, tool_defs, monkeypatch, history):
+    """Test that every turn of a tool loop sends the same cacheable system prefix"""
+    fake_client = FakeClient(script=scripted_turns(
+        [
+            ("get_course_outline", {"course_title": "Python Basics"}),
+            ("search_course_content", {"query": "Object-Oriented Programming"})
+        ],
+        "Java Advanced and C++ Fundamentals cover OOP too."
+    ))
+    monkeypatch.setattr(generator, "client", fake_client)
     
-    # Execute
-    result = generator.generate_response(
-        query="Search for Python courses",
-        tools=tool_manager.get_tool_definitions(),
+    generator.generate_response(
+        query="Find courses that cover similar topics to lesson 4 of Python Basics",
+        conversation_history=history,
+        tools=tool_defs,
         tool_manager=tool_manager
     )
     
-    print("\n[PASS] Backward compatibility test passed! Single tool calls still work.")
-    print(f"   Result: {result}")
+    systems = [call["system"] for call in fake_client.messages.calls]
+    assert len(systems) == 3
+    
+    # The static prompt carries the breakpoint, ahead of any per-session history
+    assert systems[0][0]["text"] == AIGenerator.SYSTEM_PROMPT
+    assert systems[0][0]["cache_control"]["type"] == "ephemeral"
+    if history:
+        assert "cache_control" not in systems[0][1]
+    
+    # Later turns reuse the very same prefix rather than a rebuilt copy
+    assert all(system is systems[0] for system in systems)
     
-    return True
+    # The tool schemas end with their own breakpoint on tool-enabled turns
+    assert fake_client.messages.calls[0]["tools"][-1]["cache_control"]["type"] == "ephemeral"
 
 
-if __name__ == "__main__":
-    print("Running integration tests for sequential tool calling...\n")
+@pytest.mark.parametrize("max_tool_rounds", [1, 4, 16])
+def test_history_grows_in_place_across_rounds(generator, tool_manager, tool_defs, monkeypatch,
+                                              max_tool_rounds):
+    """Test that each round appends to one messages list instead of rebuilding it"""
+    fake_client = FakeClient(script=scripted_turns(
+        [("search_course_content", {"query": f"topic {turn}"}) for turn in range(max_tool_rounds)],
+        "Summary of every topic."
+    ))
+    monkeypatch.setattr(generator, "client", fake_client)
+    
+    # The same list is passed on every call, so record its length as it is sent
+    sent = []
+    create = fake_client.messages.create
+    
+    def recording_create(**kwargs):
+        sent.append((kwargs["messages"], len(kwargs["messages"])))
+        return create(**kwargs)
+    
+    monkeypatch.setattr(fake_client.messages, "create", recording_create)
+    
+    result = generator.generate_response(
+        query="Summarise every topic",
+        tools=tool_defs,
+        tool_manager=tool_manager,
+        max_tool_rounds=max_tool_rounds
+    )
+    
+    assert result == "Summary of every topic."
+    assert len(tool_manager.tools["search_course_content"].calls) == max_tool_rounds
     
-    try:
-        test_sequential_tool_execution()
-        test_single_tool_still_works()
-        print("\n[SUCCESS] All integration tests passed!")
-    except AssertionError as e:
-        print(f"\n[FAIL] Test failed: {e}")
-        sys.exit(1)
-    except Exception as e:
-        print(f"\n[ERROR] Unexpected error: {e}")
-        import traceback
-        traceback.print_exc()
-        sys.exit(1)
\ No newline at end of file
+    # One call per round plus the final synthesis, all sharing a single list
+    # that grows by an assistant turn and a tool result each round
+    assert len(sent) == max_tool_rounds + 1
+    assert all(messages is sent[0][0] for messages, _ in sent)
+    assert [length for _, length in sent] == [1 + 2 * turn for turn in range(max_tool_rounds + 1)]
@@ -0,0 +1,77 @@
+import unittest
+from unittest.mock import patch
+
+from rate_limiter import TokenBucket, CircuitBreaker, CircuitOpenError
+
+
+class TestTokenBucket(unittest.TestCase):
+    """Test the TokenBucket class"""
+    
+    @patch('rate_limiter.time.monotonic', return_value=100.0)
+    def test_burst_then_wait(self, mock_monotonic):
+        """Test that a full bucket allows a burst, then reports the wait for more"""
+        bucket = TokenBucket(rate=1, capacity=2)
+        
+        self.assertEqual(bucket.reserve(1), 0.0)
+        self.assertEqual(bucket.reserve(1), 0.0)
+        self.assertAlmostEqual(bucket.reserve(1), 1.0)
+        self.assertAlmostEqual(bucket.reserve(1), 2.0)
+    
+    @patch('rate_limiter.time.monotonic')
+    def test_refills_over_time(self, mock_monotonic):
+        """Test that tokens accrue at the configured rate up to capacity"""
+        mock_monotonic.return_value = 100.0
+        bucket = TokenBucket.per_minute(60)
+        bucket.reserve(60)
+        
+        mock_monotonic.return_value = 110.0
+        self.assertEqual(bucket.reserve(10), 0.0)
+        self.assertAlmostEqual(bucket.reserve(1), 1.0)
+    
+    @patch('rate_limiter.time.monotonic', return_value=100.0)
+    def test_oversized_request_capped_at_capacity(self, mock_monotonic):
+        """Test that a request larger than the bucket can still proceed"""
+        bucket = TokenBucket(rate=10, capacity=100)
+        self.assertEqual(bucket.reserve(500), 0.0)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Test the CircuitBreaker class"""
+    
+    @patch('rate_limiter.time.monotonic')
+    def test_opens_after_threshold_and_probes_after_timeout(self, mock_monotonic):
+        """Test the closed -> open -> probe -> closed cycle"""
+        mock_monotonic.return_value = 100.0
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        
+        breaker.record_failure()
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        
+        # After the cooldown one probe is admitted, concurrent callers are not
+        mock_monotonic.return_value = 131.0
+        breaker.before_call()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        
+        breaker.record_success()
+        self.assertFalse(breaker.is_open)
+        breaker.before_call()
+    
+    @patch('rate_limiter.time.monotonic')
+    def test_failed_probe_reopens(self, mock_monotonic):
+        """Test that a failing probe restarts the cooldown"""
+        mock_monotonic.return_value = 100.0
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        breaker.record_failure()
+        
+        mock_monotonic.return_value = 131.0
+        breaker.before_call()
+        breaker.record_failure()
+        
+        mock_monotonic.return_value = 150.0
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
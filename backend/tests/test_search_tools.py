@@ -0,0 +1,137 @@
+import threading
+import unittest
+
+from search_tools import RequestSources, Tool, ToolManager
+from tool_executor import run_tool_calls
+from fakes import FakeToolUse
+
+
+class EchoTool(Tool):
+    """Sync tool reporting the thread it ran on"""
+    
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+    
+    def get_tool_definition(self):
+        return {"name": "echo", "description": "Echo", "input_schema": {"type": "object"}}
+    
+    def execute(self, **kwargs) -> str:
+        if self.delay:
+            threading.Event().wait(self.delay)
+        return threading.current_thread().name
+
+
+class SourceTool(Tool):
+    """Sync tool recording its query as a source, optionally after a wait"""
+    
+    last_sources = RequestSources()
+    
+    def __init__(self, release: threading.Event = None):
+        self.release = release
+        self.last_sources = []
+    
+    def get_tool_definition(self):
+        return {"name": "source", "description": "Source", "input_schema": {"type": "object"}}
+    
+    def execute(self, query: str) -> str:
+        if self.release is not None:
+            self.release.wait(5)
+        self.last_sources = [query]
+        return query
+
+
+class TestToolDefinitionCache(unittest.TestCase):
+    """Test caching of tool definitions in ToolManager"""
+    
+    def test_definitions_cached_until_tools_change(self):
+        """Test that definitions are reused and rebuilt after registration"""
+        manager = ToolManager()
+        manager.register_tool(EchoTool())
+        definitions = manager.get_tool_definitions()
+        
+        self.assertIsInstance(definitions, tuple)
+        self.assertIs(manager.get_tool_definitions(), definitions)
+        
+        del manager.tools["echo"]
+        self.assertEqual(manager.get_tool_definitions(), ())
+    
+    def test_assigning_tools_resets_cache(self):
+        """Test that replacing the tools mapping invalidates cached definitions"""
+        manager = ToolManager()
+        self.assertEqual(manager.get_tool_definitions(), ())
+        
+        manager.tools = {"echo": EchoTool()}
+        
+        self.assertEqual([d["name"] for d in manager.get_tool_definitions()], ["echo"])
+
+
+class TestToolManagerAsync(unittest.IsolatedAsyncioTestCase):
+    """Test async execution of sync tools"""
+    
+    async def test_sync_tool_runs_on_shared_pool(self):
+        """Test that sync tools are offloaded to the shared tool thread pool"""
+        manager = ToolManager()
+        manager.register_tool(EchoTool())
+        
+        thread_name = await manager.execute_tool_async("echo")
+        
+        self.assertTrue(thread_name.startswith("ai-tool"))
+    
+    async def test_slow_tool_times_out(self):
+        """Test that a tool exceeding tool_timeout returns an error message"""
+        manager = ToolManager(tool_timeout=0.05)
+        manager.register_tool(EchoTool(delay=0.5))
+        
+        result = await manager.execute_tool_async("echo")
+        
+        self.assertEqual(result, "Tool 'echo' timed out after 0.05 seconds")
+    
+    async def test_unknown_tool(self):
+        """Test that unknown tool names are reported rather than raised"""
+        result = await ToolManager().execute_tool_async("missing")
+        self.assertEqual(result, "Tool 'missing' not found")
+
+
+class TestRequestSources(unittest.TestCase):
+    """Test that tool sources are kept per query"""
+    
+    def test_sources_recorded_in_pool_threads_stay_per_context(self):
+        """Test that pooled calls record sources only in their own query's context"""
+        manager = ToolManager()
+        manager.register_tool(SourceTool())
+        first, second = manager.sources_context(), manager.sources_context()
+        
+        first.run(run_tool_calls, manager.execute_tool, [FakeToolUse("source", {"query": "a"}, "t1")], 5)
+        
+        self.assertEqual(first.run(manager.get_last_sources), ["a"])
+        self.assertEqual(second.run(manager.get_last_sources), [])
+        self.assertEqual(manager.get_last_sources(), [])
+    
+    def test_late_call_cannot_leak_into_next_query(self):
+        """Test that a call finishing after its query timed it out keeps its sources to itself"""
+        release = threading.Event()
+        tool = SourceTool(release)
+        manager = ToolManager()
+        manager.register_tool(tool)
+        first = manager.sources_context()
+        
+        try:
+            results = first.run(
+                run_tool_calls, manager.execute_tool, [FakeToolUse("source", {"query": "late"}, "t1")], 0.05
+            )
+            self.assertEqual(results, ["Tool 'source' timed out after 0.05 seconds"])
+            
+            # The next query runs while the orphaned call is still blocked
+            tool.release = None
+            next_query = manager.sources_context()
+            next_query.run(manager.execute_tool, "source", query="fresh")
+        finally:
+            release.set()
+        
+        # Once the orphan finishes, its sources land in its own query only
+        for _ in range(100):
+            if first.run(manager.get_last_sources):
+                break
+            threading.Event().wait(0.01)
+        self.assertEqual(first.run(manager.get_last_sources), ["late"])
+        self.assertEqual(next_query.run(manager.get_last_sources), ["fresh"])
@@ -0,0 +1,141 @@
+import asyncio
+import threading
+import unittest
+
+from tool_executor import ToolTimeout, run_tool_calls, run_tool_calls_async, timeout_message
+from fakes import FakeToolUse
+
+
+def blocks(*calls):
+    """Build tool_use blocks from (tool name, input) pairs"""
+    return [FakeToolUse(name, tool_input, f"tool_{i}") for i, (name, tool_input) in enumerate(calls)]
+
+
+class RecordingExecutor:
+    """Tool executor that records call order and overlap between same-tool calls"""
+    
+    def __init__(self, delay: float = 0, barrier: threading.Barrier = None):
+        self.delay = delay
+        self.barrier = barrier
+        self.calls = []
+        self.overlapped = False
+        self._active = set()
+        self._lock = threading.Lock()
+    
+    def __call__(self, tool_name: str, **kwargs) -> str:
+        with self._lock:
+            self.overlapped |= tool_name in self._active
+            self._active.add(tool_name)
+            self.calls.append((tool_name, kwargs))
+        if self.barrier is not None:
+            self.barrier.wait()
+        if self.delay:
+            threading.Event().wait(self.delay)
+        with self._lock:
+            self._active.discard(tool_name)
+        return f"{tool_name}:{kwargs.get('query')}"
+
+
+class TestRunToolCalls(unittest.TestCase):
+    """Test scheduling of sync tool rounds"""
+    
+    def test_same_tool_calls_run_in_order(self):
+        """Test that calls to one tool never overlap and keep block order"""
+        execute = RecordingExecutor(delay=0.01)
+        tool_blocks = blocks(("search", {"query": "a"}), ("outline", {"query": "b"}),
+                             ("search", {"query": "c"}))
+        
+        results = run_tool_calls(execute, tool_blocks, timeout=5)
+        
+        self.assertEqual(results, ["search:a", "outline:b", "search:c"])
+        self.assertFalse(execute.overlapped)
+        search_calls = [kwargs["query"] for name, kwargs in execute.calls if name == "search"]
+        self.assertEqual(search_calls, ["a", "c"])
+    
+    def test_different_tools_run_concurrently(self):
+        """Test that calls to different tools overlap on the shared pool"""
+        # Each call blocks until both are running, so sequential execution would time out
+        execute = RecordingExecutor(barrier=threading.Barrier(2, timeout=5))
+        
+        results = run_tool_calls(execute, blocks(("search", {"query": "a"}), ("outline", {"query": "b"})))
+        
+        self.assertEqual(results, ["search:a", "outline:b"])
+    
+    def test_slow_call_times_out(self):
+        """Test that a call exceeding the timeout is reported in its slot"""
+        def execute(tool_name, **kwargs):
+            if tool_name == "slow":
+                threading.Event().wait(0.5)
+            return tool_name
+        
+        results = run_tool_calls(execute, blocks(("slow", {}), ("fast", {})), timeout=0.05)
+        
+        self.assertEqual(results, ["Tool 'slow' timed out after 0.05 seconds", "fast"])
+
+
+    def test_timeout_stops_later_calls_to_same_tool(self):
+        """Test that a timed-out call is never overlapped by the next call to its tool"""
+        release = threading.Event()
+        execute = RecordingExecutor()
+        
+        def slow_first(tool_name, **kwargs):
+            if kwargs["query"] == "a":
+                release.wait(5)
+            return execute(tool_name, **kwargs)
+        
+        try:
+            results = run_tool_calls(slow_first, blocks(
+                ("search", {"query": "a"}), ("search", {"query": "b"}), ("outline", {"query": "c"})
+            ), timeout=0.05)
+        finally:
+            release.set()
+        
+        timed_out = "Tool 'search' timed out after 0.05 seconds"
+        self.assertEqual(results, [timed_out, timed_out, "outline:c"])
+        self.assertIsInstance(results[1], ToolTimeout)
+        self.assertNotIn(("search", {"query": "b"}), execute.calls)
+
+
+class TestRunToolCallsAsync(unittest.IsolatedAsyncioTestCase):
+    """Test scheduling of async tool rounds"""
+    
+    async def test_same_tool_sequential_other_tools_concurrent(self):
+        """Test the same ordering rules as the sync scheduler"""
+        active = set()
+        overlapped = set()
+        both_running = asyncio.Event()
+        
+        async def execute(tool_name, **kwargs):
+            if tool_name in active:
+                overlapped.add(tool_name)
+            active.add(tool_name)
+            if len(active) == 2:
+                both_running.set()
+            await asyncio.wait_for(both_running.wait(), timeout=5)
+            active.discard(tool_name)
+            return f"{tool_name}:{kwargs['query']}"
+        
+        results = await run_tool_calls_async(execute, blocks(
+            ("search", {"query": "a"}), ("outline", {"query": "b"}), ("search", {"query": "c"})
+        ))
+        
+        self.assertEqual(results, ["search:a", "outline:b", "search:c"])
+        self.assertEqual(overlapped, set())
+    
+    async def test_timeout_stops_later_calls_to_same_tool(self):
+        """Test that calls after a timed-out one reuse its result without running"""
+        calls = []
+        
+        async def execute(tool_name, **kwargs):
+            calls.append(kwargs["query"])
+            if kwargs["query"] == "a":
+                return timeout_message(tool_name, 0.05)
+            return f"{tool_name}:{kwargs['query']}"
+        
+        results = await run_tool_calls_async(execute, blocks(
+            ("search", {"query": "a"}), ("search", {"query": "b"}), ("outline", {"query": "c"})
+        ))
+        
+        timed_out = "Tool 'search' timed out after 0.05 seconds"
+        self.assertEqual(results, [timed_out, timed_out, "outline:c"])
+        self.assertEqual(sorted(calls), ["a", "c"])
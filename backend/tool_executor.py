@@ -0,0 +1,121 @@
+import asyncio
+import atexit
+import contextvars
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+# Worker threads for tool calls, shared by the sync tool loop and by
+# ToolManager.execute_tool_async so concurrent requests cannot spawn
+# unbounded threads
+TOOL_POOL = ThreadPoolExecutor(max_workers=32, thread_name_prefix="ai-tool")
+atexit.register(TOOL_POOL.shutdown, wait=False, cancel_futures=True)
+
+
+class ToolTimeout(str):
+    """Tool result reported in place of a call that ran out of time"""
+    pass
+
+
+def timeout_message(tool_name: str, timeout: float) -> ToolTimeout:
+    """Build the result for a tool call that took longer than `timeout` seconds"""
+    return ToolTimeout(f"Tool '{tool_name}' timed out after {timeout:g} seconds")
+
+
+def _group_by_tool(tool_blocks: Sequence) -> List[List[int]]:
+    """Indices of the tool_use blocks, grouped by tool name in block order"""
+    groups: Dict[str, List[int]] = {}
+    for index, block in enumerate(tool_blocks):
+        groups.setdefault(block.name, []).append(index)
+    return list(groups.values())
+
+
+def run_tool_calls(execute: Callable[..., str], tool_blocks: Sequence,
+                   timeout: Optional[float] = None) -> List[str]:
+    """
+    Run one round of tool calls and return their results in block order.
+    
+    Tools keep per-call state such as last_sources, so calls to the same tool
+    run one after another in block order; calls to different tools run
+    concurrently on the shared pool. A call still running `timeout` seconds
+    after it started is reported with timeout_message() and left to finish
+    in the background; since it cannot be stopped, the remaining calls to
+    that tool are not started and are reported as timed out as well.
+    
+    Each call runs in a copy of the caller's context, so per-request state
+    such as tool sources (see ToolManager.sources_context) follows it onto
+    the pool.
+    
+    Args:
+        execute: Called as execute(tool_name, **tool_input) for each block
+        tool_blocks: tool_use content blocks from the response
+        timeout: Seconds each call may take, or None to wait indefinitely
+    """
+    groups = _group_by_tool(tool_blocks)
+    
+    # Nothing to overlap and nothing to enforce: run on the calling thread
+    if len(groups) == 1 and timeout is None:
+        return [execute(block.name, **block.input) for block in tool_blocks]
+    
+    results: List[Optional[str]] = [None] * len(tool_blocks)
+    running = {}  # future -> (block index, rest of its group, deadline)
+    
+    def start_next(queue: deque):
+        if queue:
+            index = queue.popleft()
+            block = tool_blocks[index]
+            deadline = None if timeout is None else time.monotonic() + timeout
+            future = TOOL_POOL.submit(contextvars.copy_context().run, execute, block.name, **block.input)
+            running[future] = (index, queue, deadline)
+    
+    for group in groups:
+        start_next(deque(group))
+    
+    while running:
+        deadlines = [deadline for _, _, deadline in running.values() if deadline is not None]
+        remaining = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+        done, _ = wait(running, timeout=remaining, return_when=FIRST_COMPLETED)
+        
+        now = time.monotonic()
+        for future, (index, queue, deadline) in list(running.items()):
+            if future in done:
+                results[index] = future.result()
+            elif deadline is not None and now >= deadline:
+                for pending in (index, *queue):
+                    results[pending] = timeout_message(tool_blocks[pending].name, timeout)
+                queue.clear()
+            else:
+                continue
+            del running[future]
+            start_next(queue)
+    
+    return results
+
+
+async def run_tool_calls_async(execute: Callable[..., Awaitable[str]], tool_blocks: Sequence) -> List[str]:
+    """
+    Async counterpart of run_tool_calls(), with the same ordering rules.
+    
+    Timeouts are left to `execute` (see ToolManager.execute_tool_async); once
+    a call reports a ToolTimeout, the remaining calls to that tool are not
+    started and get the same result.
+    """
+    async def run_group(group: List[int]) -> List[str]:
+        results = []
+        for index in group:
+            if results and isinstance(results[-1], ToolTimeout):
+                results.append(results[-1])
+            else:
+                results.append(await execute(tool_blocks[index].name, **tool_blocks[index].input))
+        return results
+    
+    groups = _group_by_tool(tool_blocks)
+    if len(groups) == 1:
+        return await run_group(groups[0])
+    
+    results: List[Optional[str]] = [None] * len(tool_blocks)
+    for group, group_results in zip(groups, await asyncio.gather(*map(run_group, groups))):
+        for index, result in zip(group, group_results):
+            results[index] = result
+    return results